@@ -1,19 +1,28 @@
-import os, uuid, logging, json, io, asyncio, httpx, re, requests
-from collections import defaultdict
-from datetime import datetime, timedelta
+import os, uuid, logging, json, io, html as html_lib, asyncio, httpx, re, requests, time, heapq, itertools, hashlib, csv, mmap, base64, zlib, threading
+from collections import defaultdict, Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
-from fastapi.responses import Response
+from fastapi.responses import Response, ORJSONResponse, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import Optional, List
 import motor.motor_asyncio
+from bson import Binary
+import numpy as np
+import orjson
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import pypdf
 
 FMP_API_KEY = os.getenv("FMP_API_KEY", "")
 FMP_BASE    = "https://financialmodelingprep.com/api"
+FMP_RATE_PER_MIN = int(os.getenv("FMP_RATE_PER_MIN", "300"))
+FMP_BURST        = int(os.getenv("FMP_BURST", "20"))
+FMP_DAILY_QUOTA  = int(os.getenv("FMP_DAILY_QUOTA", "0"))   # 0 = plan has no daily cap
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
@@ -24,9 +33,11 @@ JWT_ALGORITHM   = "HS256"
 JWT_EXPIRE_DAYS = 30
 GEMINI_API_KEY  = os.getenv("GEMINI_API_KEY", "")
 GROQ_API_KEY    = os.getenv("GROQ_API_KEY", "")
+DATA_DIR        = os.getenv("FINSIGHT_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
 
 executor = ThreadPoolExecutor(max_workers=4)
-app = FastAPI(title="FinSight API v14")
+auth_executor = ThreadPoolExecutor(max_workers=2)   # bcrypt only, so logins can't starve PDF work
+app = FastAPI(title="FinSight API v14", default_response_class=ORJSONResponse)
 
 # ─── CORS ────────────────────────────────────────────────────────────────────
 from fastapi.middleware.cors import CORSMiddleware
@@ -37,24 +48,98 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     expose_headers=["*"],
+    max_age=86400,
 )
 
-@app.middleware("http")
-async def cors_middleware(request: Request, call_next):
-    if request.method == "OPTIONS":
-        r = Response()
-        r.headers.update({
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET,POST,PUT,DELETE,OPTIONS,PATCH",
-            "Access-Control-Allow-Headers": "Authorization,Content-Type,Accept,X-Requested-With",
-            "Access-Control-Max-Age": "86400",
-        })
-        return r
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,DELETE,OPTIONS,PATCH"
-    response.headers["Access-Control-Allow-Headers"] = "Authorization,Content-Type,Accept,X-Requested-With"
-    return response
+# ─── COMPRESSION ─────────────────────────────────────────────────────────────
+# Pure ASGI so bodies are not re-buffered by BaseHTTPMiddleware. Small or
+# already-encoded responses pass through; streamed bodies are flushed per chunk.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_COMPRESS_MIN_BYTES = 1024
+_COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+def _pick_encoding(accept: str) -> Optional[str]:
+    offered = {}
+    for part in accept.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try: q = float(params.strip()[2:])
+            except ValueError: q = 0.0
+        offered[name.strip()] = q
+    if brotli and offered.get("br", 0) > 0: return "br"
+    if offered.get("gzip", 0) > 0: return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.br = encoding == "br"
+        self._c = brotli.Compressor(quality=4) if self.br else zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        if self.br:
+            out = self._c.process(data)
+            return out + (self._c.finish() if final else self._c.flush())
+        return self._c.compress(data) + self._c.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = _COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = _pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if ("content-encoding" in headers
+                        or not headers.get("content-type", "").startswith(_COMPRESSIBLE_TYPES)
+                        or (not more and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                del headers["content-length"]
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more:
+                    out = compressor.chunk(body, True)
+                    headers["content-length"] = str(len(out))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": out})
+                    return
+                await send(start)
+            await send({"type": "http.response.body", "body": compressor.chunk(body, not more),
+                        "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+app.add_middleware(CompressionMiddleware)
 
 # ─── DB ──────────────────────────────────────────────────────────────────────
 mongo_client  = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
@@ -62,37 +147,60 @@ db            = mongo_client.finsight
 users_col     = db.users
 analyses_col  = db.analyses
 companies_col = db.companies
+sync_meta_col = db.sync_meta
+analysis_results_col = db.analysis_results
+analyses_archive_col = db.analyses_archive
+filings_col   = db.filings
+financial_facts_col = db.financial_facts
 
 # ─── AUTH ────────────────────────────────────────────────────────────────────
 pwd_ctx  = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer(auto_error=False)
 
-def hash_pw(pw): return pwd_ctx.hash(pw)
-def verify_pw(p, h): return pwd_ctx.verify(p, h)
+async def hash_pw(pw):
+    return await asyncio.get_event_loop().run_in_executor(auth_executor, pwd_ctx.hash, pw)
+
+async def verify_pw(p, h):
+    return await asyncio.get_event_loop().run_in_executor(auth_executor, pwd_ctx.verify, p, h)
 
 def create_token(uid):
     exp = datetime.utcnow() + timedelta(days=JWT_EXPIRE_DAYS)
     return jwt.encode({"sub": uid, "exp": exp}, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(creds: HTTPAuthorizationCredentials = Depends(security)):
-    if not creds: raise HTTPException(401, "Not authenticated")
+# Bearer token -> the user fields handlers read, so authenticated requests skip
+# the JWT decode and the users lookup. Entries never outlive the token. Nothing
+# in the API edits or removes accounts; an out-of-band change (e.g. deleting a
+# user in Mongo) takes effect within _USER_CACHE_TTL.
+_USER_CACHE_TTL = 60
+_USER_CACHE_MAX = 10000
+_USER_FIELDS    = {"_id": 0, "user_id": 1, "name": 1, "email": 1}
+_user_cache: dict = {}   # token -> (expires_at epoch, user)
+
+async def _user_for_token(token: str) -> dict:
+    now = time.time()
+    hit = _user_cache.get(token)
+    if hit and hit[0] > now: return dict(hit[1])
     try:
-        payload = jwt.decode(creds.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        uid = payload.get("sub")
-        if not uid: raise HTTPException(401, "Invalid token")
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except JWTError:
         raise HTTPException(401, "Token expired or invalid — please sign in again")
-    user = await users_col.find_one({"user_id": uid})
+    uid = payload.get("sub")
+    if not uid: raise HTTPException(401, "Invalid token")
+    user = await users_col.find_one({"user_id": uid}, _USER_FIELDS)
     if not user: raise HTTPException(401, "Account not found — please sign in again")
-    return user
+    if len(_user_cache) >= _USER_CACHE_MAX:
+        for tok in [t for t, (exp, _) in _user_cache.items() if exp <= now]: _user_cache.pop(tok, None)
+        if len(_user_cache) >= _USER_CACHE_MAX: _user_cache.clear()
+    _user_cache[token] = (min(now + _USER_CACHE_TTL, payload.get("exp") or now), user)
+    return dict(user)
+
+async def get_current_user(creds: HTTPAuthorizationCredentials = Depends(security)):
+    if not creds: raise HTTPException(401, "Not authenticated")
+    return await _user_for_token(creds.credentials)
 
 async def get_optional_user(creds: HTTPAuthorizationCredentials = Depends(security)):
     if not creds: return None
-    try:
-        payload = jwt.decode(creds.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        uid = payload.get("sub")
-        if not uid: return None
-        return await users_col.find_one({"user_id": uid})
+    try: return await _user_for_token(creds.credentials)
     except: return None
 
 # ─── MODELS ──────────────────────────────────────────────────────────────────
@@ -104,6 +212,13 @@ class LoginRequest(BaseModel):
 
 class AnalyzeFromURLRequest(BaseModel):
     pdf_url: str; filename: str; source: str
+    symbol: Optional[str] = None
+
+class BatchAnalyzeRequest(BaseModel):
+    symbols: List[str] = []
+    filings: List[AnalyzeFromURLRequest] = []
+    consolidated: bool = True
+    max_age_hours: int = 24
 
 class PDFRequest(BaseModel):
     html: str
@@ -120,40 +235,194 @@ NSE_HEADERS = {**BROWSER_HEADERS, "Referer": "https://www.nseindia.com/", "Origi
 BSE_HEADERS = {**BROWSER_HEADERS, "Referer": "https://www.bseindia.com/", "Origin": "https://www.bseindia.com"}
 
 
+# ─── EXCHANGE SESSIONS ───────────────────────────────────────────────────────
+# NSE/BSE hand out bot-protection cookies from their home pages. One long-lived
+# client per exchange holds that cookie jar: it is warmed once, re-warmed
+# shortly before the cookies go stale while the exchange is in use, and
+# re-warmed immediately when a request comes back 401/403.
+_SESSION_REWARM_MIN_INTERVAL = 30
+
+
+class _ExchangeSession:
+    def __init__(self, name: str, home: str, headers: dict, max_age: int):
+        self.name, self.home, self.headers, self.max_age = name, home, headers, max_age
+        self.client: Optional[httpx.AsyncClient] = None
+        self.warmed_at = 0.0
+        self.last_used = 0.0
+        self.warm_count = 0
+        self._lock = asyncio.Lock()
+
+    async def _warm(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+        self.client.cookies.clear()
+        try:
+            await self.client.get(self.home, headers=self.headers, timeout=15)
+        except Exception as e:
+            logger.warning(f"{self.name} session warm-up failed: {e}")
+        self.warmed_at = time.monotonic()
+        self.warm_count += 1
+
+    async def _rewarm(self, seen: float):
+        """Re-warm unless another caller already did since `seen`."""
+        async with self._lock:
+            if self.warmed_at > seen or time.monotonic() - self.warmed_at < _SESSION_REWARM_MIN_INTERVAL:
+                return
+            logger.info(f"{self.name} session rejected — re-warming")
+            await self._warm()
+
+    async def ready(self) -> httpx.AsyncClient:
+        self.last_used = time.monotonic()
+        if self.client is None or time.monotonic() - self.warmed_at > self.max_age:
+            async with self._lock:
+                if self.client is None or time.monotonic() - self.warmed_at > self.max_age:
+                    await self._warm()
+        return self.client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        kwargs.setdefault("headers", self.headers)
+        c = await self.ready()
+        seen = self.warmed_at
+        r = await c.request(method, url, **kwargs)
+        if r.status_code in (401, 403):
+            await self._rewarm(seen)
+            r = await self.client.request(method, url, **kwargs)
+        return r
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        kwargs.setdefault("headers", self.headers)
+        c = await self.ready()
+        for attempt in range(2):
+            seen = self.warmed_at
+            async with c.stream(method, url, **kwargs) as r:
+                if r.status_code not in (401, 403) or attempt:
+                    yield r
+                    return
+            await self._rewarm(seen)
+
+    async def keep_warm(self):
+        while True:
+            await asyncio.sleep(max(self.max_age * 0.2, 30))
+            now = time.monotonic()
+            if (self.client is not None and now - self.last_used < self.max_age
+                    and now - self.warmed_at > self.max_age * 0.8):
+                async with self._lock:
+                    await self._warm()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def status(self) -> dict:
+        age = time.monotonic() - self.warmed_at if self.client else None
+        return {"warm": self.client is not None, "age_s": round(age) if age is not None else None,
+                "warm_count": self.warm_count}
+
+
+nse_session = _ExchangeSession("NSE", "https://www.nseindia.com/", NSE_HEADERS, max_age=20 * 60)
+bse_session = _ExchangeSession("BSE", "https://www.bseindia.com/", BSE_HEADERS, max_age=60 * 60)
+EXCHANGE_SESSIONS = {"nse": nse_session, "bse": bse_session}
+
+
 # ─── COMPANY MASTER SYNC ─────────────────────────────────────────────────────
+# Syncs are diff-based: each company carries a content hash per exchange
+# (nse_hash / bse_hash) and only inserts, changed rows and delistings are written,
+# as unordered bulk batches with a few batches in flight.
+_SYNC_BATCH        = 500
+_SYNC_CONCURRENCY  = 4
+_SYNC_DELIST_FLOOR = 0.9   # skip delistings if the feed is much shorter than what we hold
+
+
+def _content_hash(*fields) -> str:
+    return hashlib.sha1("\x1f".join(str(f or "") for f in fields).encode()).hexdigest()[:16]
+
+
+async def _load_company_state() -> dict:
+    proj = {"_id": 0, "symbol": 1, "bse_code": 1, "nse_hash": 1, "bse_hash": 1, "nse_listed": 1, "bse_listed": 1}
+    return {d["symbol"]: d async for d in companies_col.find({}, proj) if d.get("symbol")}
+
+
+async def _apply_company_ops(ops: list) -> int:
+    if not ops: return 0
+    sem = asyncio.Semaphore(_SYNC_CONCURRENCY)
+
+    async def _write(batch):
+        async with sem:
+            await companies_col.bulk_write(batch, ordered=False)
+
+    await asyncio.gather(*[_write(ops[i:i + _SYNC_BATCH]) for i in range(0, len(ops), _SYNC_BATCH)])
+    return len(ops)
+
+
+async def _record_sync(source: str, records: int, stats: dict):
+    await sync_meta_col.update_one({"_id": source},
+        {"$set": {"synced_at": datetime.utcnow().isoformat(), "records": records, **stats}}, upsert=True)
+
+
 async def sync_nse_companies() -> int:
     url = "https://nsearchives.nseindia.com/content/equities/EQUITY_L.csv"
     count = 0
     try:
-        async with httpx.AsyncClient(timeout=60, follow_redirects=True) as c:
-            await c.get("https://www.nseindia.com/", headers=NSE_HEADERS)
-            r = await c.get(url, headers=NSE_HEADERS)
-            r.raise_for_status()
-        lines = r.text.splitlines()
-        if len(lines) < 2: return 0
-        header = [h.strip().upper() for h in lines[0].split(",")]
-        try:
-            sym_idx  = header.index("SYMBOL")
-            name_idx = header.index("NAME OF COMPANY")
-            isin_idx = header.index("ISIN NUMBER") if "ISIN NUMBER" in header else -1
-        except ValueError as e:
-            logger.error(f"NSE CSV header mismatch: {e}"); return 0
         from pymongo import UpdateOne
-        ops = []
-        for line in lines[1:]:
-            parts = line.split(",")
-            if len(parts) <= max(sym_idx, name_idx): continue
-            symbol = parts[sym_idx].strip().upper()
-            name   = parts[name_idx].strip().title()
-            isin   = parts[isin_idx].strip() if isin_idx != -1 and len(parts) > isin_idx else ""
-            if not symbol or not name: continue
-            ops.append(UpdateOne({"symbol": symbol},
-                {"$set": {"symbol": symbol, "name": name, "isin": isin, "nse_listed": True, "active": True, "updated_at": datetime.utcnow().isoformat()}},
-                upsert=True))
-        for i in range(0, len(ops), 500):
-            await companies_col.bulk_write(ops[i:i+500])
-            count += len(ops[i:i+500])
-        logger.info(f"NSE sync: {count} records")
+        existing = await _load_company_state()
+        now  = datetime.utcnow().isoformat()
+        ops  = []
+        seen = set()
+        stats = {"inserted": 0, "changed": 0, "delisted": 0}
+        async with nse_session.stream("GET", url, timeout=60) as r:
+            r.raise_for_status()
+            header = None
+            async for line in r.aiter_lines():
+                if not line.strip(): continue
+                parts = next(csv.reader([line]))
+                if header is None:
+                    header = [h.strip().upper() for h in parts]
+                    try:
+                        sym_idx  = header.index("SYMBOL")
+                        name_idx = header.index("NAME OF COMPANY")
+                        isin_idx = header.index("ISIN NUMBER") if "ISIN NUMBER" in header else -1
+                    except ValueError as e:
+                        logger.error(f"NSE CSV header mismatch: {e}"); return 0
+                    continue
+                if len(parts) <= max(sym_idx, name_idx): continue
+                symbol = parts[sym_idx].strip().upper()
+                name   = parts[name_idx].strip().title()
+                isin   = parts[isin_idx].strip() if isin_idx != -1 and len(parts) > isin_idx else ""
+                if not symbol or not name or symbol in seen: continue
+                seen.add(symbol)
+                h   = _content_hash(name, isin)
+                cur = existing.get(symbol)
+                if cur and cur.get("nse_hash") == h and cur.get("nse_listed"): continue
+                stats["changed" if cur else "inserted"] += 1
+                ops.append(UpdateOne({"symbol": symbol},
+                    {"$set": {"symbol": symbol, "name": name, "isin": isin, "nse_listed": True, "active": True,
+                              "nse_hash": h, "updated_at": now}},
+                    upsert=True))
+        count = len(seen)
+
+        listed = [sym for sym, d in existing.items() if d.get("nse_listed") and not sym.startswith("BSE_")]
+        if count >= len(listed) * _SYNC_DELIST_FLOOR:
+            for sym in listed:
+                if sym in seen: continue
+                stats["delisted"] += 1
+                ops.append(UpdateOne({"symbol": sym},
+                    {"$set": {"nse_listed": False, "active": bool(existing[sym].get("bse_listed")), "updated_at": now}}))
+        elif listed:
+            logger.warning(f"NSE feed has {count} rows vs {len(listed)} listed — skipping delistings")
+
+        writes = await _apply_company_ops(ops)
+        await _record_sync("nse", count, stats)
+        logger.info(f"NSE sync: {count} records, {writes} writes "
+                    f"(inserted={stats['inserted']}, changed={stats['changed']}, delisted={stats['delisted']})")
+        if writes:
+            company_repo.invalidate()
+        if writes or not _search_index.ready:
+            await rebuild_search_index()
     except Exception as e:
         logger.error(f"NSE sync failed: {e}")
     return count
@@ -163,14 +432,18 @@ async def sync_bse_companies() -> int:
     url = "https://api.bseindia.com/BseIndiaAPI/api/ListofScripData/w?Group=&Scripcode=&industry=&segment=Equity&status=Active"
     count = 0
     try:
-        async with httpx.AsyncClient(timeout=60, follow_redirects=True) as c:
-            r = await c.get(url, headers=BSE_HEADERS)
-            r.raise_for_status()
-            data = r.json()
+        from pymongo import UpdateOne
+        existing = await _load_company_state()
+        by_code  = {d["bse_code"]: sym for sym, d in existing.items() if d.get("bse_code")}
+        r = await bse_session.get(url, timeout=60)
+        r.raise_for_status()
+        data = r.json()
         items = data if isinstance(data, list) else data.get("Table", data.get("data", []))
         logger.info(f"BSE returned {len(items)} scrips")
-        from pymongo import UpdateOne
-        ops = []
+        now  = datetime.utcnow().isoformat()
+        ops  = []
+        seen = set()
+        stats = {"inserted": 0, "changed": 0, "delisted": 0}
         for item in items:
             bse_code = str(item.get("SCRIP_CD") or item.get("scripCode") or item.get("ScripCode") or "").strip()
             nse_sym  = (item.get("NSE_SYMBOL") or item.get("nseSymbol") or item.get("scrip_id") or "").strip().upper()
@@ -178,21 +451,41 @@ async def sync_bse_companies() -> int:
             isin     = (item.get("ISIN_NO") or item.get("isinNumber") or item.get("ISIN") or "").strip()
             sector   = (item.get("INDUSTRY") or item.get("industry") or "").strip().title()
             if not bse_code or not name: continue
-            if nse_sym:
-                ops.append(UpdateOne({"symbol": nse_sym},
-                    {"$set": {"bse_code": bse_code, "isin": isin, "sector": sector, "bse_listed": True, "active": True, "updated_at": datetime.utcnow().isoformat()}},
-                    upsert=False))
-                ops.append(UpdateOne({"symbol": nse_sym},
-                    {"$setOnInsert": {"symbol": nse_sym, "name": name, "bse_code": bse_code, "isin": isin, "sector": sector, "nse_listed": False, "bse_listed": True, "active": True, "updated_at": datetime.utcnow().isoformat()}},
-                    upsert=True))
-            else:
-                ops.append(UpdateOne({"bse_code": bse_code},
-                    {"$set": {"symbol": f"BSE_{bse_code}", "name": name, "bse_code": bse_code, "isin": isin, "sector": sector, "nse_listed": False, "bse_listed": True, "active": True, "updated_at": datetime.utcnow().isoformat()}},
-                    upsert=True))
+            symbol = nse_sym or by_code.get(bse_code) or f"BSE_{bse_code}"
+            if symbol in seen: continue
+            seen.add(symbol)
             count += 1
-        for i in range(0, len(ops), 500):
-            await companies_col.bulk_write(ops[i:i+500])
-        logger.info(f"BSE sync: {count} records")
+            h   = _content_hash(bse_code, name, isin, sector)
+            cur = existing.get(symbol)
+            if cur and cur.get("bse_hash") == h and cur.get("bse_listed"): continue
+            fields = {"bse_code": bse_code, "isin": isin, "sector": sector, "bse_listed": True, "active": True,
+                      "bse_hash": h, "updated_at": now}
+            if symbol.startswith("BSE_"):
+                fields["name"] = name
+            stats["changed" if cur else "inserted"] += 1
+            ops.append(UpdateOne({"symbol": symbol},
+                {"$set": fields, "$setOnInsert": {"symbol": symbol, "nse_listed": False,
+                                                  **({} if "name" in fields else {"name": name})}},
+                upsert=True))
+
+        listed = [sym for sym, d in existing.items() if d.get("bse_listed")]
+        if count >= len(listed) * _SYNC_DELIST_FLOOR:
+            for sym in listed:
+                if sym in seen: continue
+                stats["delisted"] += 1
+                ops.append(UpdateOne({"symbol": sym},
+                    {"$set": {"bse_listed": False, "active": bool(existing[sym].get("nse_listed")), "updated_at": now}}))
+        elif listed:
+            logger.warning(f"BSE feed has {count} scrips vs {len(listed)} listed — skipping delistings")
+
+        writes = await _apply_company_ops(ops)
+        await _record_sync("bse", count, stats)
+        logger.info(f"BSE sync: {count} records, {writes} writes "
+                    f"(inserted={stats['inserted']}, changed={stats['changed']}, delisted={stats['delisted']})")
+        if writes:
+            company_repo.invalidate()
+        if writes or not _search_index.ready:
+            await rebuild_search_index()
     except Exception as e:
         logger.error(f"BSE sync failed: {e}")
     return count
@@ -205,24 +498,38 @@ async def ensure_indexes():
     await companies_col.create_index([("name", "text"), ("symbol", "text")])
     await analyses_col.create_index("analysis_id")
     await analyses_col.create_index("user_id")
+    await analyses_col.create_index([("user_id", 1), ("created_at", -1), ("analysis_id", -1)])
     try: await users_col.create_index("email", unique=True)
     except: pass
+    await ensure_retention_indexes()
+    await filings_col.create_index([("symbol", 1), ("filed_at", -1)])
+    await filings_col.create_index([("discovered_at", -1)])
+    await analyses_col.create_index("pdf_url", sparse=True)
+    await analyses_col.create_index([("symbol", 1), ("created_at", -1)], sparse=True)
+    await financial_facts_col.create_index([("symbol", 1), ("period", -1)])
+    await financial_facts_col.create_index([("period_type", 1), ("consolidated", 1), ("symbol", 1), ("period", -1)])
+    await financial_facts_col.create_index([("period_type", 1), ("consolidated", 1), ("period", -1)])
+    for field in _FACT_INDEXED:
+        await financial_facts_col.create_index([("period_type", 1), ("period", 1), ("consolidated", 1), (field, 1)])
+        await financial_facts_col.create_index([("period_type", 1), ("consolidated", 1), ("is_latest", 1), (field, 1)])
     logger.info("Indexes ensured")
 
 
 async def initial_sync():
     await ensure_indexes()
     count = await companies_col.count_documents({})
+    if count:
+        await rebuild_search_index()
     if count == 0:
         logger.info("Company master empty — full sync starting...")
         n = await sync_nse_companies()
         b = await sync_bse_companies()
         logger.info(f"Initial sync done — NSE:{n}, BSE:{b}")
     else:
-        latest = await companies_col.find_one({}, sort=[("updated_at", -1)])
+        synced  = [m async for m in sync_meta_col.find({"_id": {"$in": ["nse", "bse"]}})]
         age_hrs = 999
-        if latest:
-            try: age_hrs = (datetime.utcnow() - datetime.fromisoformat(latest["updated_at"])).total_seconds() / 3600
+        if len(synced) == 2:
+            try: age_hrs = max((datetime.utcnow() - datetime.fromisoformat(m["synced_at"])).total_seconds() / 3600 for m in synced)
             except: pass
         if age_hrs > 24:
             logger.info(f"Data {age_hrs:.0f}h old — refreshing in background")
@@ -239,11 +546,448 @@ async def _daily_sync_loop():
 
 @app.on_event("startup")
 async def on_startup():
+    await load_search_index_from_snapshot()
     asyncio.create_task(initial_sync())
     asyncio.create_task(_daily_sync_loop())
+    asyncio.create_task(_watch_company_changes())
+    asyncio.create_task(_retention_loop())
+    asyncio.create_task(backfill_latest_facts())
+    asyncio.create_task(_filings_crawl_loop())
+    asyncio.create_task(_preanalysis_loop())
+    asyncio.create_task(_screener_refresh_loop())
+    for session in EXCHANGE_SESSIONS.values():
+        asyncio.create_task(session.keep_warm())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for session in EXCHANGE_SESSIONS.values():
+        await session.close()
+
+
+# ─── COMPANY REPOSITORY ──────────────────────────────────────────────────────
+# All point lookups of company docs go through here: multi-gets are one `$in`
+# round trip, results are cached briefly by symbol and BSE code, and callers ask
+# only for the fields they use (a cached doc serves any subset of its fields).
+_COMPANY_CACHE_TTL = 300
+_COMPANY_CACHE_MAX = 5000
+COMPANY_LIST_FIELDS = ("symbol", "name", "sector", "isin", "bse_code", "nse_listed", "bse_listed")
+
+
+class _CompanyRepository:
+    def __init__(self):
+        self._cache: dict = {}   # (field, key) -> (expires_at, doc, fields or None for full doc)
+
+    def _lookup(self, by: str, key: str, fields) -> Optional[dict]:
+        entry = self._cache.get((by, key))
+        if not entry: return None
+        expires, doc, cached_fields = entry
+        if expires < time.monotonic():
+            self._cache.pop((by, key), None); return None
+        if cached_fields is not None and (fields is None or not set(fields) <= cached_fields):
+            return None
+        return {k: v for k, v in doc.items() if fields is None or k in fields}
+
+    def _store(self, doc: dict, fields):
+        if len(self._cache) >= _COMPANY_CACHE_MAX:
+            now = time.monotonic()
+            self._cache = {k: v for k, v in self._cache.items() if v[0] >= now}
+            if len(self._cache) >= _COMPANY_CACHE_MAX: self._cache.clear()
+        entry = (time.monotonic() + _COMPANY_CACHE_TTL, doc, None if fields is None else frozenset(fields))
+        if doc.get("symbol"):   self._cache[("symbol", doc["symbol"])] = entry
+        if doc.get("bse_code"): self._cache[("bse_code", str(doc["bse_code"]))] = entry
+
+    async def get_many(self, keys: List[str], by: str = "symbol", fields=None) -> dict:
+        """Return {key: doc} for the keys that exist; cache misses cost one `$in` query."""
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            doc = self._lookup(by, key, fields)
+            if doc is not None: found[key] = doc
+            else: missing.append(key)
+        if missing:
+            proj = {"_id": 0}
+            if fields is not None:
+                proj.update({f: 1 for f in set(fields) | {"symbol", "bse_code"}})
+            async for doc in companies_col.find({by: {"$in": missing}}, proj):
+                self._store(doc, fields)
+                key = str(doc.get(by, ""))
+                if key in missing and key not in found:
+                    found[key] = {k: v for k, v in doc.items() if fields is None or k in fields}
+        return found
+
+    async def get(self, key: str, by: str = "symbol", fields=None) -> Optional[dict]:
+        return (await self.get_many([key], by, fields)).get(key)
+
+    def invalidate(self, symbol: str = None):
+        if symbol is None:
+            self._cache.clear(); return
+        entry = self._cache.pop(("symbol", symbol), None)
+        if entry and entry[1].get("bse_code"):
+            self._cache.pop(("bse_code", str(entry[1]["bse_code"])), None)
+
+
+company_repo = _CompanyRepository()
+
+
+# ─── COMPANY SEARCH INDEX ────────────────────────────────────────────────────
+# In-process type-ahead index over the company master: a prefix trie over symbol,
+# name, ISIN and BSE code (each node keeps its best-ranked ids), plus trigram
+# postings over name+symbol for infix matches. Built from Mongo after every sync
+# and kept current from the companies change stream where Mongo supports it.
+_SEARCH_TRIE_DEPTH = 12
+_SEARCH_NODE_CAP   = 32
+_FUZZY_CANDIDATES  = 32
+_FUZZY_COMMON_GRAM = 2500   # skip near-universal trigrams ("lim", "ted") when others exist
+
+POPULAR_SYMBOLS = ["RELIANCE","TCS","HDFCBANK","INFY","ICICIBANK","SBIN",
+                   "BAJFINANCE","ZOMATO","LT","WIPRO","ADANIENT","TATAMOTORS","HINDUNILVR","ITC","AXISBANK"]
+_POPULAR_SET = set(POPULAR_SYMBOLS)
+
+
+def _search_norm(text: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (text or "").lower()).split())
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _osa_distance(a: str, b: str, max_d: int) -> int:
+    """Optimal-string-alignment edit distance (adjacent swaps cost 1); returns max_d+1 past the bound."""
+    if abs(len(a) - len(b)) > max_d: return max_d + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        ca, cur, row_min = a[i - 1], [i], i
+        for j in range(1, len(b) + 1):
+            cb = b[j - 1]
+            v = prev[j - 1] + (ca != cb)
+            if prev[j] + 1 < v: v = prev[j] + 1
+            if cur[j - 1] + 1 < v: v = cur[j - 1] + 1
+            if prev2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb and prev2[j - 2] + 1 < v:
+                v = prev2[j - 2] + 1
+            cur.append(v)
+            if v < row_min: row_min = v
+        if row_min > max_d: return max_d + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _token_similarity(q: str, tokens: list, memo: dict) -> float:
+    """Best similarity of query token `q` against any candidate token (prefixes count as matches)."""
+    best = 0.0
+    max_d = 1 if len(q) <= 4 else 2
+    for t in tokens:
+        key = (q, t)
+        sim = memo.get(key)
+        if sim is None:
+            if t == q: sim = 1.0
+            elif len(q) >= 2 and t.startswith(q): sim = 0.95
+            else:
+                d = _osa_distance(q, t[:len(q) + max_d], max_d) if len(t) > len(q) else _osa_distance(q, t, max_d)
+                sim = 1 - d / max(len(q), len(t), 1) if d <= max_d else 0.0
+            memo[key] = sim
+        if sim > best:
+            best = sim
+            if best == 1.0: break
+    return best
+
+
+class _CompanySearchIndex:
+    def __init__(self):
+        self.docs: list  = []     # id -> company doc (None once superseded/removed)
+        self.keys: list  = []     # id -> (norm symbol, norm name, isin, bse_code)
+        self.rank: list  = []     # id -> static rank, higher first
+        self.by_symbol: dict = {}
+        self.by_key: dict    = defaultdict(set)   # norm symbol / isin / bse code -> ids
+        self.by_oid: dict    = {}
+        self.trie: dict      = {}
+        self.grams: dict     = defaultdict(set)
+        self.ready = False
+        self._bulk = False
+
+    def __len__(self):
+        return len(self.by_symbol)
+
+    @staticmethod
+    def _static_rank(doc: dict) -> tuple:
+        return ((doc.get("symbol") or "").upper() in _POPULAR_SET,
+                2 * bool(doc.get("nse_listed")) + bool(doc.get("bse_listed")), -len(doc.get("name") or ""))
+
+    def _trie_insert(self, key: str, cid: int):
+        node = self.trie
+        for ch in key[:_SEARCH_TRIE_DEPTH]:
+            node = node.setdefault(ch, {})
+            ids = node.setdefault("", [])
+            if self._bulk:
+                if not ids or ids[-1] != cid: ids.append(cid)
+                continue
+            if cid in ids: continue
+            ids.append(cid)
+            if len(ids) > 1:
+                ids.sort(key=lambda i: self.rank[i], reverse=True)
+                del ids[_SEARCH_NODE_CAP:]
+
+    def finish_bulk(self):
+        """Rank-sort and cap every trie node after a bulk load."""
+        stack = [self.trie]
+        while stack:
+            node = stack.pop()
+            ids = node.get("")
+            if ids and len(ids) > 1:
+                ids.sort(key=lambda i: self.rank[i], reverse=True)
+                del ids[_SEARCH_NODE_CAP:]
+            stack.extend(v for k, v in node.items() if k)
+        self._bulk = False
+
+    def upsert(self, doc: dict, oid=None):
+        symbol = (doc.get("symbol") or "").upper()
+        if not symbol: return
+        doc = {k: v for k, v in doc.items() if k not in ("nse_hash", "bse_hash")}
+        self.remove(symbol)
+        cid = len(self.docs)
+        sym_n, name_n = _search_norm(symbol), _search_norm(doc.get("name", ""))
+        isin, bse = (doc.get("isin") or "").lower(), str(doc.get("bse_code") or "")
+        self.docs.append(doc)
+        self.keys.append((sym_n, name_n, isin, bse))
+        self.rank.append(self._static_rank(doc))
+        self.by_symbol[symbol] = cid
+        if oid is not None: self.by_oid[str(oid)] = symbol
+        for key in (sym_n, isin, bse):
+            if key: self.by_key[key].add(cid)
+        for key in (sym_n, name_n, isin, bse):
+            if key: self._trie_insert(key, cid)
+        for g in _trigrams(f" {name_n} {sym_n} "):
+            self.grams[g].add(cid)
+
+    def remove(self, symbol: str):
+        cid = self.by_symbol.pop(symbol.upper(), None)
+        if cid is None: return
+        self.docs[cid] = None
+        # unlink the dead id so it stops holding a capped trie slot until the next rebuild
+        sym_n, name_n, isin, bse = self.keys[cid]
+        for key in (sym_n, isin, bse):
+            ids = self.by_key.get(key)
+            if ids is not None:
+                ids.discard(cid)
+                if not ids: del self.by_key[key]
+        for key in (sym_n, name_n, isin, bse):
+            node = self.trie
+            for ch in key[:_SEARCH_TRIE_DEPTH]:
+                node = node.get(ch)
+                if node is None: break
+                ids = node.get("")
+                if ids and cid in ids: ids.remove(cid)
+        for g in _trigrams(f" {name_n} {sym_n} "):
+            ids = self.grams.get(g)
+            if ids is not None:
+                ids.discard(cid)
+                if not ids: del self.grams[g]
+
+    def remove_oid(self, oid):
+        symbol = self.by_oid.pop(str(oid), None)
+        if symbol: self.remove(symbol)
+
+    def _score(self, cid: int, q: str) -> int:
+        sym_n, name_n, isin, bse = self.keys[cid]
+        if q in (sym_n, isin, bse): return 100
+        if sym_n.startswith(q): return 80
+        if isin.startswith(q) or bse.startswith(q): return 70
+        if name_n.startswith(q): return 60
+        if q in name_n or q in sym_n: return 40
+        return 0
+
+    def search(self, query: str, limit: int = 15) -> List[dict]:
+        q = _search_norm(query)
+        if not q: return []
+        # exact symbol/ISIN/BSE hits first: a capped trie node may have ranked them out
+        scored: dict = {cid: 100 for cid in self.by_key.get(q, ())}
+        exact = self.by_symbol.get(query.strip().upper())
+        if exact is not None: scored[exact] = 100
+
+        node = self.trie
+        for ch in q[:_SEARCH_TRIE_DEPTH]:
+            node = node.get(ch)
+            if node is None: break
+        else:
+            for cid in node.get("", []):
+                if cid not in scored and self.docs[cid] is not None:
+                    sc = self._score(cid, q)
+                    if sc: scored[cid] = sc
+
+        if len(scored) < limit and len(q) >= 3:
+            postings = sorted((self.grams.get(g, set()) for g in _trigrams(q)), key=len)
+            if postings and postings[0]:
+                # the rarest few trigrams narrow enough; _score verifies the substring
+                cands = postings[0].intersection(*postings[1:3])
+                for cid in heapq.nlargest(limit * 4, cands, key=self.rank.__getitem__):
+                    if cid in scored or self.docs[cid] is None: continue
+                    sc = self._score(cid, q)
+                    if sc: scored[cid] = sc
+
+        if len(scored) < limit:
+            for cid, sc in self._fuzzy(q, limit * 2).items():
+                scored.setdefault(cid, sc)
+
+        best = sorted(scored, key=lambda i: (scored[i], self.rank[i]), reverse=True)[:limit]
+        return [dict(self.docs[i]) for i in best]
+
+    def _fuzzy(self, q: str, limit: int) -> dict:
+        """Typo-tolerant matches scored below exact/prefix/infix hits (0-39)."""
+        q_tokens = q.split()
+        q_grams  = set().union(*(_trigrams(f" {t} ") for t in q_tokens))
+        postings = [(g, self.grams.get(g)) for g in q_grams]
+        postings = [(g, p) for g, p in postings if p]
+        if not postings: return {}
+        rare = [p for _, p in postings if len(p) <= _FUZZY_COMMON_GRAM]
+        counts = Counter()
+        for p in (rare or [p for _, p in postings]):
+            counts.update(p)
+
+        q_compact = q.replace(" ", "")
+        memo, out = {}, {}
+        for cid in heapq.nlargest(_FUZZY_CANDIDATES, counts, key=counts.__getitem__):
+            doc = self.docs[cid]
+            if doc is None: continue
+            sym_n, name_n, _, _ = self.keys[cid]
+            name_tokens = name_n.split()
+            token_sim = sum(_token_similarity(t, name_tokens, memo) for t in q_tokens) / len(q_tokens)
+            sym_c = sym_n.replace(" ", "")
+            sym_d = _osa_distance(q_compact, sym_c, 2)
+            sym_sim = 1 - sym_d / max(len(q_compact), len(sym_c), 1) if sym_d <= 2 else 0.0
+            if token_sim < 0.6 and sym_sim < 0.75: continue
+            containment = counts[cid] / len(q_grams)
+            popular, listing, _ = self.rank[cid]
+            score = (18 * max(token_sim, sym_sim) + 8 * containment
+                     + (4 if sym_sim >= 0.75 else 0) + (5 if popular else 0) + listing)
+            out[cid] = min(int(score), 39)
+        return dict(heapq.nlargest(limit, out.items(), key=lambda kv: kv[1]))
+
+
+_search_index = _CompanySearchIndex()
+
+
+def _build_search_index(docs: list) -> _CompanySearchIndex:
+    idx = _CompanySearchIndex()
+    idx._bulk = True
+    for doc in docs:
+        oid = doc.pop("_id", None)
+        idx.upsert(doc, oid)
+    idx.finish_bulk()
+    idx.ready = True
+    return idx
+
+
+async def rebuild_search_index() -> int:
+    global _search_index
+    try:
+        docs = await companies_col.find({}).to_list(length=None)
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        _search_index = await loop.run_in_executor(executor, _build_search_index, docs)
+        logger.info(f"Search index rebuilt: {len(_search_index):,} companies in {time.perf_counter() - started:.2f}s")
+        if docs:
+            await loop.run_in_executor(executor, write_company_snapshot, docs)
+    except Exception as e:
+        logger.error(f"Search index rebuild failed: {e}")
+    return len(_search_index)
+
+
+# ─── COMPANY SNAPSHOT ────────────────────────────────────────────────────────
+# Compact local copy of the company master (one tab-separated line per company),
+# rewritten atomically after every index rebuild and memory-mapped at startup so
+# a fresh pod can answer search before Mongo is reachable.
+COMPANY_SNAPSHOT_PATH  = os.getenv("COMPANY_SNAPSHOT_PATH", os.path.join(DATA_DIR, "companies.snap"))
+_SNAPSHOT_MAGIC        = b"FSNAP1"
+_SNAPSHOT_FIELDS       = ("symbol", "name", "isin", "bse_code", "sector")
+
+
+def write_company_snapshot(docs: list, path: str = None) -> int:
+    path = path or COMPANY_SNAPSHOT_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    rows = 0
+    with open(tmp, "wb") as f:
+        f.write(b"%s\t%s\n" % (_SNAPSHOT_MAGIC, datetime.utcnow().isoformat().encode()))
+        for d in docs:
+            if not d.get("symbol"): continue
+            cols = [re.sub(r"[\t\n\r]", " ", str(d.get(k) or "")) for k in _SNAPSHOT_FIELDS]
+            cols.append(("N" if d.get("nse_listed") else "") + ("B" if d.get("bse_listed") else ""))
+            f.write("\t".join(cols).encode() + b"\n")
+            rows += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    logger.info(f"Company snapshot written: {rows:,} rows → {path}")
+    return rows
+
+
+def load_company_snapshot(path: str = None) -> list:
+    path = path or COMPANY_SNAPSHOT_PATH
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    docs = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if not mm.readline().startswith(_SNAPSHOT_MAGIC):
+            logger.warning(f"Ignoring company snapshot with unknown format: {path}")
+            return []
+        for line in iter(mm.readline, b""):
+            cols = line.rstrip(b"\n").decode("utf-8", "replace").split("\t")
+            if len(cols) != len(_SNAPSHOT_FIELDS) + 1: continue
+            doc = {k: v for k, v in zip(_SNAPSHOT_FIELDS, cols) if v}
+            doc.update({"nse_listed": "N" in cols[-1], "bse_listed": "B" in cols[-1], "active": True})
+            docs.append(doc)
+    return docs
+
+
+async def load_search_index_from_snapshot() -> int:
+    """Build the search index from the local snapshot unless a Mongo-built index already exists."""
+    global _search_index
+    try:
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        docs = await loop.run_in_executor(executor, load_company_snapshot)
+        if not docs or _search_index.ready:
+            return 0
+        idx = await loop.run_in_executor(executor, _build_search_index, docs)
+        if not _search_index.ready:
+            _search_index = idx
+        logger.info(f"Search index loaded from snapshot: {len(idx):,} companies in {time.perf_counter() - started:.2f}s")
+        return len(idx)
+    except Exception as e:
+        logger.warning(f"Company snapshot load failed: {e}")
+        return 0
+
+
+async def _watch_company_changes():
+    """Apply company master changes to the search index (change streams need a replica set)."""
+    from pymongo.errors import PyMongoError
+    while True:
+        try:
+            async with companies_col.watch(full_document="updateLookup") as stream:
+                logger.info("Watching companies change stream for search index updates")
+                async for change in stream:
+                    op = change.get("operationType")
+                    if op in ("insert", "update", "replace") and change.get("fullDocument"):
+                        doc = change["fullDocument"]
+                        _search_index.upsert(doc, doc.pop("_id", None))
+                        company_repo.invalidate(doc.get("symbol"))
+                    elif op == "delete":
+                        _search_index.remove_oid(change.get("documentKey", {}).get("_id"))
+                        company_repo.invalidate()
+        except PyMongoError as e:
+            if "replica set" in str(e).lower() or getattr(e, "code", None) == 40573:
+                logger.info("Change streams unavailable — search index refreshes after each sync only")
+                return
+            logger.warning(f"Company change stream interrupted: {e}")
+        await asyncio.sleep(30)
 
 
 async def search_companies(query: str, limit: int = 15) -> List[dict]:
+    if _search_index.ready:
+        return _search_index.search(query, limit)
+    return await _search_companies_mongo(query, limit)
+
+
+async def _search_companies_mongo(query: str, limit: int = 15) -> List[dict]:
     q_upper = query.strip().upper()
     q_orig  = query.strip()
     results: List[dict] = []
@@ -282,61 +1026,84 @@ def _classify_filing(title: str) -> str:
 async def fetch_nse_filings(symbol: str) -> List[dict]:
     filings = []
     try:
-        async with httpx.AsyncClient(timeout=20, follow_redirects=True) as c:
-            await c.get("https://www.nseindia.com/", headers=NSE_HEADERS)
-            r = await c.get(
-                f"https://www.nseindia.com/api/annual-reports?symbol={symbol}&issuer={symbol}&type=annual-report",
-                headers=NSE_HEADERS)
-            if r.status_code == 200:
-                try:
-                    data = r.json()
-                except Exception:
-                    data = {}
-                items = data.get("data") or (data if isinstance(data, list) else [])
-                for item in items[:10]:
-                    pdf = (item.get("fileName") or item.get("pdfName") or item.get("attachment") or "").strip()
-                    if not pdf: continue
-                    if not pdf.startswith("http"):
-                        pdf = f"https://www.nseindia.com/corporate-governance/annexure/{pdf}"
-                    filings.append({"title": item.get("subject") or item.get("fileDesc") or "Annual Report",
-                                    "date": item.get("dt") or item.get("sort_date") or "",
-                                    "pdf_url": pdf, "type": "Annual Report", "source": "NSE", "symbol": symbol})
-                if filings:
-                    return filings
-            for category in ["annual-report", "financial-results"]:
-                r2 = await c.get(
-                    f"https://www.nseindia.com/api/corporates-announcements?index=equities&symbol={symbol}&category={category}",
-                    headers=NSE_HEADERS)
-                if r2.status_code != 200: continue
-                data2  = r2.json()
-                items2 = data2.get("data", []) if isinstance(data2, dict) else (data2 if isinstance(data2, list) else [])
-                for item in items2[:15]:
-                    pdf   = (item.get("attchmntFile") or item.get("attachment") or "").strip()
-                    title = item.get("subject") or item.get("desc") or "Filing"
-                    if not pdf: continue
-                    if not pdf.startswith("http"):
-                        pdf = f"https://www.nseindia.com/{pdf.lstrip('/')}"
-                    filings.append({"title": title, "date": item.get("an_dt") or item.get("dt") or "",
-                                    "pdf_url": pdf, "type": _classify_filing(title), "source": "NSE", "symbol": symbol})
-                if filings:
-                    return filings[:10]
+        r = await nse_session.get(
+            f"https://www.nseindia.com/api/annual-reports?symbol={symbol}&issuer={symbol}&type=annual-report",
+            timeout=20)
+        if r.status_code == 200:
+            try:
+                data = r.json()
+            except Exception:
+                data = {}
+            items = data.get("data") or (data if isinstance(data, list) else [])
+            for item in items[:10]:
+                pdf = (item.get("fileName") or item.get("pdfName") or item.get("attachment") or "").strip()
+                if not pdf: continue
+                if not pdf.startswith("http"):
+                    pdf = f"https://www.nseindia.com/corporate-governance/annexure/{pdf}"
+                filings.append({"title": item.get("subject") or item.get("fileDesc") or "Annual Report",
+                                "date": item.get("dt") or item.get("sort_date") or "",
+                                "pdf_url": pdf, "type": "Annual Report", "source": "NSE", "symbol": symbol})
+            if filings:
+                return filings
+        for category in ["annual-report", "financial-results"]:
+            r2 = await nse_session.get(
+                f"https://www.nseindia.com/api/corporates-announcements?index=equities&symbol={symbol}&category={category}",
+                timeout=20)
+            if r2.status_code != 200: continue
+            data2  = r2.json()
+            items2 = data2.get("data", []) if isinstance(data2, dict) else (data2 if isinstance(data2, list) else [])
+            for item in items2[:15]:
+                pdf   = (item.get("attchmntFile") or item.get("attachment") or "").strip()
+                title = item.get("subject") or item.get("desc") or "Filing"
+                if not pdf: continue
+                if not pdf.startswith("http"):
+                    pdf = f"https://www.nseindia.com/{pdf.lstrip('/')}"
+                filings.append({"title": title, "date": item.get("an_dt") or item.get("dt") or "",
+                                "pdf_url": pdf, "type": _classify_filing(title), "source": "NSE", "symbol": symbol})
+            if filings:
+                return filings[:10]
     except Exception as e:
         logger.warning(f"NSE filings error for {symbol}: {e}")
     return filings
 
 
-async def verify_pdf_url(c: httpx.AsyncClient, url: str) -> bool:
+async def verify_pdf_url(url: str) -> bool:
     try:
-        r = await c.head(url, headers=BSE_HEADERS, timeout=8)
+        r = await bse_session.request("HEAD", url, timeout=8)
         if r.status_code == 405:
-            r = await c.get(url, headers={**BSE_HEADERS, "Range": "bytes=0-10"}, timeout=8)
+            r = await bse_session.get(url, headers={**BSE_HEADERS, "Range": "bytes=0-10"}, timeout=8)
         return r.status_code in (200, 206)
     except: return False
 
 
+# BSE serves a filing from AttachLive first and moves it to AttachHis later, so
+# which candidate works is remembered per attachment name. AttachHis is final;
+# AttachLive is rechecked daily; names that verified nowhere are retried soon.
+_PDF_VERIFY_CONCURRENCY = 8
+_BSE_ATTACH_TTL = {"AttachHis": 30 * 86400, "AttachLive": 86400, None: 3600}
+_BSE_ATTACH_CACHE_MAX = 20000
+_pdf_verify_sem = asyncio.Semaphore(_PDF_VERIFY_CONCURRENCY)
+_bse_attach_cache: dict = {}   # pdf_name -> (expires_at, url or None)
+
+async def _resolve_bse_attachment(pdf_name: str) -> str:
+    candidates = [f"https://www.bseindia.com/xml-data/corpfiling/AttachLive/{pdf_name}",
+                  f"https://www.bseindia.com/xml-data/corpfiling/AttachHis/{pdf_name}"]
+    hit = _bse_attach_cache.get(pdf_name)
+    if hit and hit[0] > time.time():
+        return hit[1] or candidates[0]
+    working, folder = None, None
+    async with _pdf_verify_sem:
+        for candidate, name in zip(candidates, ("AttachLive", "AttachHis")):
+            if await verify_pdf_url(candidate):
+                working, folder = candidate, name
+                break
+    if len(_bse_attach_cache) >= _BSE_ATTACH_CACHE_MAX: _bse_attach_cache.clear()
+    _bse_attach_cache[pdf_name] = (time.time() + _BSE_ATTACH_TTL[folder], working)
+    return working or candidates[0]
+
+
 async def fetch_bse_filings(bse_code: str, symbol: str) -> List[dict]:
     if not bse_code: return []
-    filings: List[dict] = []
     try:
         from datetime import date as _date
         to_dt   = _date.today().strftime("%Y%m%d")
@@ -347,38 +1114,395 @@ async def fetch_bse_filings(bse_code: str, symbol: str) -> List[dict]:
                     f"?pageno=1&strCat={cat}&strPrevDate={from_dt}&strScrip={bse_code}"
                     f"&strSearch=P&strToDate={to_dt}&strType=C")
 
-        def _pdf_candidates(pdf_name):
-            return [f"https://www.bseindia.com/xml-data/corpfiling/AttachLive/{pdf_name}",
-                    f"https://www.bseindia.com/xml-data/corpfiling/AttachHis/{pdf_name}"]
-
-        async with httpx.AsyncClient(timeout=25, follow_redirects=True) as c:
-            await c.get("https://www.bseindia.com/", headers=BSE_HEADERS)
-            for cat, max_items, forced_type in [("Result", 20, None), ("Annual+Report", 8, "Annual Report")]:
-                r = await c.get(_bse_api(cat), headers=BSE_HEADERS)
-                if r.status_code != 200: continue
-                items = r.json().get("Table", [])
-                for item in items[:max_items]:
-                    pdf_name = item.get("ATTACHMENTNAME", "").strip()
-                    if not pdf_name: continue
-                    title = item.get("SUBJECT") or item.get("CATEGORYNAME") or "Financial Results"
-                    candidates = _pdf_candidates(pdf_name)
-                    working_url = None
-                    for candidate in candidates:
-                        if await verify_pdf_url(c, candidate):
-                            working_url = candidate
-                            break
-                    if not working_url:
-                        working_url = candidates[0]
-                    filings.append({"title": title, "date": item.get("NEWS_DT", ""),
-                                    "pdf_url": working_url,
-                                    "type": forced_type or _classify_filing(title),
-                                    "source": "BSE", "symbol": symbol, "bse_code": bse_code})
+        entries = []
+        for cat, max_items, forced_type in [("Result", 20, None), ("Annual+Report", 8, "Annual Report")]:
+            r = await bse_session.get(_bse_api(cat), timeout=25)
+            if r.status_code != 200: continue
+            items = r.json().get("Table", [])
+            for item in items[:max_items]:
+                pdf_name = item.get("ATTACHMENTNAME", "").strip()
+                if not pdf_name: continue
+                entries.append((item, pdf_name, forced_type))
+        urls = await asyncio.gather(*(_resolve_bse_attachment(name) for _, name, _ in entries))
+        filings: List[dict] = []
+        for (item, _, forced_type), url in zip(entries, urls):
+            title = item.get("SUBJECT") or item.get("CATEGORYNAME") or "Financial Results"
+            filings.append({"title": title, "date": item.get("NEWS_DT", ""),
+                            "pdf_url": url,
+                            "type": forced_type or _classify_filing(title),
+                            "source": "BSE", "symbol": symbol, "bse_code": bse_code})
         return filings[:15]
     except Exception as e:
         logger.warning(f"BSE filings error for {bse_code}: {e}")
     return []
 
 
+# Per-symbol listing cache: fresh for _FILINGS_TTL, then served stale (up to
+# _FILINGS_STALE_MAX) while one background refresh runs. Empty listings, which
+# usually mean an upstream hiccup, are only trusted briefly.
+_FILINGS_TTL       = 900
+_FILINGS_EMPTY_TTL = 60
+_FILINGS_STALE_MAX = 86400
+_filings_cache: dict = {}      # symbol -> (fetched_at, payload)
+_filings_inflight: dict = {}   # symbol -> task
+
+def _parse_filing_date(d):
+    d = (d or "").strip().split(".")[0]
+    for fmt in ["%d %b %Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%b %d, %Y", "%Y%m%d",
+                "%d-%b-%Y %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d-%b-%Y"]:
+        try: return datetime.strptime(d, fmt)
+        except: pass
+    return datetime.min
+
+async def _load_filings(symbol: str, company: dict) -> dict:
+    bse_code = company.get("bse_code", "")
+    results  = await asyncio.gather(
+        fetch_nse_filings(symbol),
+        fetch_bse_filings(bse_code, symbol) if bse_code else asyncio.sleep(0),
+        return_exceptions=True)
+    nse_filings = results[0] if isinstance(results[0], list) else []
+    bse_filings = results[1] if isinstance(results[1], list) else []
+
+    all_filings = bse_filings + nse_filings
+    seen: set = set()
+    unique: List[dict] = []
+    for f in all_filings:
+        key = f["title"][:40].lower()
+        if key not in seen: seen.add(key); unique.append(f)
+
+    unique.sort(key=lambda x: _parse_filing_date(x.get("date", "")), reverse=True)
+    if unique:
+        try:
+            await index_filings(unique)
+            await companies_col.update_one({"symbol": symbol}, {"$set": {"filings_indexed_at": datetime.utcnow()}})
+            company_repo.invalidate(symbol)
+        except Exception as e:
+            logger.warning(f"Filing backfill failed for {symbol}: {e}")
+    payload = {"symbol": symbol, "company": company.get("name", symbol), "sector": company.get("sector", ""),
+               "isin": company.get("isin", ""), "bse_code": bse_code, "filings": unique[:15], "total": len(unique)}
+    _filings_cache[symbol] = (time.time(), payload)
+    return payload
+
+def _refresh_filings(symbol: str, company: dict) -> asyncio.Task:
+    task = _filings_inflight.get(symbol)
+    if task is None:
+        task = asyncio.create_task(_load_filings(symbol, company))
+        _filings_inflight[symbol] = task
+        task.add_done_callback(lambda _t: _filings_inflight.pop(symbol, None))
+    return task
+
+async def get_company_filings(symbol: str, company: dict) -> dict:
+    entry = _filings_cache.get(symbol)
+    if entry:
+        fetched_at, payload = entry
+        age = time.time() - fetched_at
+        if age < (_FILINGS_TTL if payload["filings"] else _FILINGS_EMPTY_TTL):
+            return payload
+        if payload["filings"] and age < _FILINGS_STALE_MAX:
+            _refresh_filings(symbol, company)
+            return payload
+    return await asyncio.shield(_refresh_filings(symbol, company))
+
+
+# ─── FILING INDEX ────────────────────────────────────────────────────────────
+# filings holds one normalised record per exchange attachment. A symbol is
+# backfilled from the per-company endpoints the first time it is viewed
+# (companies.filings_indexed_at marks that); after that a crawler polling the
+# market-wide announcement feeds keeps it current and get_filings is a single
+# indexed query. Records are keyed "<source>:<attachment file name>".
+_FILINGS_CRAWL_INTERVAL = 180
+_FILINGS_CRAWL_LOOKBACK = 7     # days of catch-up after downtime
+_BSE_CRAWL_MAX_PAGES    = 20
+_FILING_SUBJECT_RE = re.compile(r"result|annual report", re.I)
+_IST = timezone(timedelta(hours=5, minutes=30))
+FILING_FIELDS = ("title", "date", "pdf_url", "type", "source", "symbol", "bse_code")
+
+def _filing_id(source: str, pdf_url: str) -> str:
+    return f"{source.lower()}:{pdf_url.rstrip('/').rsplit('/', 1)[-1]}"
+
+def _filing_record(f: dict) -> dict:
+    filed = _parse_filing_date(f.get("date", ""))
+    rec = {k: f[k] for k in FILING_FIELDS if f.get(k) not in (None, "")}
+    rec["filed_at"] = filed if filed != datetime.min else None
+    return rec
+
+async def index_filings(filings: List[dict]) -> int:
+    """Upsert filing dicts (the shape fetch_*_filings return); returns how many were new."""
+    from pymongo import UpdateOne
+    if not filings: return 0
+    now = datetime.utcnow()
+    ops = [UpdateOne({"_id": _filing_id(f["source"], f["pdf_url"])},
+                     {"$set": _filing_record(f), "$setOnInsert": {"discovered_at": now}}, upsert=True)
+           for f in filings if f.get("pdf_url") and f.get("symbol")]
+    if not ops: return 0
+    r = await filings_col.bulk_write(ops, ordered=False)
+    return r.upserted_count
+
+async def _known_filing_ids(ids: List[str]) -> set:
+    return {d["_id"] async for d in filings_col.find({"_id": {"$in": ids}}, {"_id": 1})}
+
+async def _crawl_nse_announcements(since) -> List[dict]:
+    today = datetime.now(_IST).date()
+    r = await nse_session.get(
+        f"https://www.nseindia.com/api/corporate-announcements?index=equities"
+        f"&from_date={since:%d-%m-%Y}&to_date={today:%d-%m-%Y}", timeout=30)
+    if r.status_code != 200:
+        logger.warning(f"NSE announcements feed HTTP {r.status_code}"); return []
+    data  = r.json()
+    items = data if isinstance(data, list) else data.get("data", [])
+    filings = []
+    for item in items:
+        title  = item.get("desc") or item.get("subject") or "Filing"
+        pdf    = (item.get("attchmntFile") or "").strip()
+        symbol = (item.get("symbol") or "").upper().strip()
+        if not pdf or not symbol: continue
+        if not _FILING_SUBJECT_RE.search(f"{title} {item.get('attchmntText') or ''}"): continue
+        if not pdf.startswith("http"):
+            pdf = f"https://www.nseindia.com/{pdf.lstrip('/')}"
+        filings.append({"title": title, "date": item.get("an_dt") or item.get("sort_date") or "",
+                        "pdf_url": pdf, "type": _classify_filing(title), "source": "NSE", "symbol": symbol})
+    known = await _known_filing_ids([_filing_id("NSE", f["pdf_url"]) for f in filings])
+    return [f for f in filings if _filing_id("NSE", f["pdf_url"]) not in known]
+
+async def _crawl_bse_announcements(since) -> List[dict]:
+    today, since_dt = datetime.now(_IST).date(), datetime(since.year, since.month, since.day)
+    entries = []
+    for cat, forced_type in [("Result", None), ("Annual+Report", "Annual Report")]:
+        for page in range(1, _BSE_CRAWL_MAX_PAGES + 1):
+            r = await bse_session.get(
+                f"https://api.bseindia.com/BseIndiaAPI/api/AnnSubCategoryGetData/w"
+                f"?pageno={page}&strCat={cat}&strPrevDate={since:%Y%m%d}&strScrip="
+                f"&strSearch=P&strToDate={today:%Y%m%d}&strType=C", timeout=30)
+            if r.status_code != 200: break
+            items = [i for i in r.json().get("Table", []) if (i.get("ATTACHMENTNAME") or "").strip()]
+            if not items: break
+            known = await _known_filing_ids([f"bse:{i['ATTACHMENTNAME'].strip()}" for i in items])
+            fresh = [i for i in items if f"bse:{i['ATTACHMENTNAME'].strip()}" not in known]
+            entries += [(i, forced_type) for i in fresh]
+            # Feed is newest-first: a page with nothing new, or reaching past the cursor, ends the scan.
+            if not fresh or _parse_filing_date(items[-1].get("NEWS_DT", "")) < since_dt: break
+    if not entries: return []
+    codes = await company_repo.get_many([str(i.get("SCRIP_CD", "")) for i, _ in entries],
+                                        by="bse_code", fields=("symbol",))
+    entries = [(i, t) for i, t in entries if str(i.get("SCRIP_CD", "")) in codes]
+    urls = await asyncio.gather(*(_resolve_bse_attachment(i["ATTACHMENTNAME"].strip()) for i, _ in entries))
+    filings = []
+    for (item, forced_type), url in zip(entries, urls):
+        title = item.get("SUBJECT") or item.get("CATEGORYNAME") or "Financial Results"
+        code  = str(item.get("SCRIP_CD", ""))
+        filings.append({"title": title, "date": item.get("NEWS_DT", ""), "pdf_url": url,
+                        "type": forced_type or _classify_filing(title), "source": "BSE",
+                        "symbol": codes[code]["symbol"], "bse_code": code})
+    return filings
+
+async def crawl_filings() -> int:
+    """One incremental pass over both exchanges' announcement feeds."""
+    floor = datetime.now(_IST).date() - timedelta(days=_FILINGS_CRAWL_LOOKBACK)
+    total = 0
+    for source, crawl in (("nse", _crawl_nse_announcements), ("bse", _crawl_bse_announcements)):
+        meta_id = f"filings_{source}"
+        meta    = await sync_meta_col.find_one({"_id": meta_id}) or {}
+        try:
+            cursor = datetime.strptime(meta["cursor"], "%Y-%m-%d").date()
+        except (KeyError, ValueError):
+            cursor = floor
+        started = datetime.now(_IST).date()
+        try:
+            filings = await crawl(max(cursor, floor))
+            new = await index_filings(filings)
+        except Exception as e:
+            logger.warning(f"{source.upper()} filing crawl failed: {e}"); continue
+        total += new
+        await sync_meta_col.update_one({"_id": meta_id}, {"$set": {
+            "cursor": started.isoformat(), "synced_at": datetime.utcnow().isoformat(), "new": new}}, upsert=True)
+    if total: logger.info(f"Filing crawl: {total} new filings indexed")
+    return total
+
+async def _filings_crawl_loop():
+    while True:
+        try:
+            await crawl_filings()
+        except Exception as e:
+            logger.error(f"Filing crawl failed: {e}")
+        await asyncio.sleep(_FILINGS_CRAWL_INTERVAL)
+
+async def indexed_filings(symbol: str, limit: int = 15) -> dict:
+    proj = {"_id": 0, **{k: 1 for k in FILING_FIELDS}}
+    docs = await (filings_col.find({"symbol": symbol}, proj)
+                  .sort([("filed_at", -1), ("_id", -1)]).limit(limit * 4).to_list(limit * 4))
+    seen: set = set()
+    unique: List[dict] = []
+    for f in docs:
+        key = f.get("title", "")[:40].lower()
+        if key not in seen: seen.add(key); unique.append(f)
+    return {"filings": unique[:limit], "total": len(unique)}
+
+
+# ─── PDF BLOB STORE ──────────────────────────────────────────────────────────
+# Downloaded filing PDFs are kept on local disk: blobs/<sha256> holds the bytes
+# (shared by every URL serving them) and urls/<sha1(url)>.json maps a URL to its
+# blob plus the validators needed to revalidate it. Exchange attachments don't
+# change, so a stored copy is used as-is for _PDF_REVALIDATE_AFTER and then
+# checked with a conditional GET. Eviction works off an in-memory LRU of the
+# blobs (seeded from blob mtimes on first use, so recency survives restarts)
+# and removes a blob together with the URL entries pointing at it. Each worker
+# process keeps its own view, so the size budget is approximate.
+PDF_STORE_DIR        = os.getenv("PDF_STORE_DIR", os.path.join(DATA_DIR, "pdfs"))
+PDF_STORE_MAX_BYTES  = int(os.getenv("PDF_STORE_MAX_MB", "2048")) * 1024 * 1024
+_PDF_REVALIDATE_AFTER = 7 * 86400
+_pdf_inflight: dict = {}   # url -> task
+
+def _pdf_paths(url: str, digest: str = None):
+    meta = os.path.join(PDF_STORE_DIR, "urls", hashlib.sha1(url.encode()).hexdigest() + ".json")
+    return meta, (os.path.join(PDF_STORE_DIR, "blobs", digest[:2], digest) if digest else None)
+
+def _atomic_write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class _PdfStoreIndex:
+    def __init__(self):
+        self.lock  = threading.Lock()
+        self.blobs: "OrderedDict[str, int]" = OrderedDict()   # sha256 -> size, least recent first
+        self.metas: dict = defaultdict(set)                   # sha256 -> url meta paths
+        self.blob_of: dict = {}                               # url meta path -> sha256
+        self.total  = 0
+        self.loaded = False
+
+    def _load(self):
+        found = []
+        for dirpath, _, files in os.walk(os.path.join(PDF_STORE_DIR, "blobs")):
+            for name in files:
+                if name.endswith(".tmp"): continue
+                try: st = os.stat(os.path.join(dirpath, name))
+                except OSError: continue
+                found.append((st.st_mtime, name, st.st_size))
+        for _, digest, size in sorted(found):
+            self.blobs[digest] = size
+            self.total += size
+        meta_root = os.path.join(PDF_STORE_DIR, "urls")
+        for name in (os.listdir(meta_root) if os.path.isdir(meta_root) else []):
+            path = os.path.join(meta_root, name)
+            try:
+                with open(path, "rb") as f:
+                    digest = json.loads(f.read())["sha256"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if digest in self.blobs:
+                self.metas[digest].add(path); self.blob_of[path] = digest
+            else:   # left behind by evictions before meta files were removed with their blob
+                try: os.remove(path)
+                except OSError: pass
+        self.loaded = True
+
+    def touch(self, digest: str):
+        with self.lock:
+            if digest in self.blobs: self.blobs.move_to_end(digest)
+
+    def add(self, digest: str, size: int, meta_path: str) -> list:
+        """Record a write; returns the files to delete to get back under budget."""
+        with self.lock:
+            if not self.loaded: self._load()
+            if digest not in self.blobs:
+                self.blobs[digest] = size
+                self.total += size
+            self.blobs.move_to_end(digest)
+            old = self.blob_of.get(meta_path)
+            if old and old != digest: self.metas[old].discard(meta_path)
+            self.metas[digest].add(meta_path); self.blob_of[meta_path] = digest
+            if self.total <= PDF_STORE_MAX_BYTES: return []
+            victims = []
+            while self.total > PDF_STORE_MAX_BYTES * 0.9 and len(self.blobs) > 1:
+                d, sz = self.blobs.popitem(last=False)
+                self.total -= sz
+                victims.append(os.path.join(PDF_STORE_DIR, "blobs", d[:2], d))
+                for m in self.metas.pop(d, ()):
+                    self.blob_of.pop(m, None); victims.append(m)
+            return victims
+
+
+_pdf_index = _PdfStoreIndex()
+
+def _pdf_store_read(url: str):
+    """(meta, content) for a stored URL; content is None if the blob was evicted."""
+    meta_path, _ = _pdf_paths(url)
+    try:
+        with open(meta_path, "rb") as f:
+            meta = json.loads(f.read())
+        _, blob_path = _pdf_paths(url, meta["sha256"])
+        with open(blob_path, "rb") as f:
+            content = f.read()
+        os.utime(blob_path)
+        _pdf_index.touch(meta["sha256"])
+        return meta, content
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+def _pdf_store_write(url: str, content: bytes, headers) -> dict:
+    digest = hashlib.sha256(content).hexdigest()
+    meta_path, blob_path = _pdf_paths(url, digest)
+    if os.path.exists(blob_path): os.utime(blob_path)
+    else: _atomic_write(blob_path, content)
+    meta = {"url": url, "sha256": digest, "size": len(content), "fetched_at": time.time(),
+            "etag": headers.get("etag"), "last_modified": headers.get("last-modified")}
+    _atomic_write(meta_path, json.dumps(meta).encode())
+    _pdf_store_evict(_pdf_index.add(digest, len(content), meta_path))
+    return meta
+
+def _pdf_store_touch(url: str, meta: dict):
+    meta_path, _ = _pdf_paths(url)
+    _atomic_write(meta_path, json.dumps({**meta, "fetched_at": time.time()}).encode())
+
+def _pdf_store_evict(paths: list):
+    if not paths: return
+    for path in paths:
+        try: os.remove(path)
+        except OSError: pass
+    logger.info(f"PDF store evicted {len(paths)} files, down to {_pdf_index.total / 1e6:.0f} MB")
+
+async def _download_pdf(url: str, source: str, conditional: dict = None) -> httpx.Response:
+    session = EXCHANGE_SESSIONS.get(source)
+    if session:
+        return await session.get(url, headers={**session.headers, **(conditional or {})}, timeout=45)
+    async with httpx.AsyncClient(timeout=45, follow_redirects=True) as c:
+        return await c.get(url, headers={**BSE_HEADERS, **(conditional or {})})
+
+async def _fetch_filing_pdf(url: str, source: str) -> bytes:
+    loop = asyncio.get_event_loop()
+    meta, content = await loop.run_in_executor(executor, _pdf_store_read, url)
+    conditional = None
+    if content is not None:
+        if time.time() - meta.get("fetched_at", 0) < _PDF_REVALIDATE_AFTER:
+            return content
+        conditional = {k: v for k, v in (("If-None-Match", meta.get("etag")),
+                                         ("If-Modified-Since", meta.get("last_modified"))) if v}
+    r = await _download_pdf(url, source, conditional)
+    if r.status_code == 304 and content is not None:
+        await loop.run_in_executor(executor, _pdf_store_touch, url, meta)
+        return content
+    if r.status_code != 200:
+        raise Exception(f"Could not fetch PDF — HTTP {r.status_code}.")
+    if "html" in r.headers.get("content-type", "").lower():
+        raise Exception("Server returned HTML instead of PDF. Filing link may have expired.")
+    try:
+        await loop.run_in_executor(executor, _pdf_store_write, url, r.content, r.headers)
+    except OSError as e:
+        logger.warning(f"PDF store write failed for {url}: {e}")
+    return r.content
+
+async def fetch_filing_pdf(url: str, source: str = "") -> bytes:
+    """Filing PDF bytes from the local store, the network, or a download already in flight."""
+    task = _pdf_inflight.get(url)
+    if task is None:
+        task = asyncio.create_task(_fetch_filing_pdf(url, source))
+        _pdf_inflight[url] = task
+        task.add_done_callback(lambda _t: _pdf_inflight.pop(url, None))
+    return await asyncio.shield(task)
+
+
 # ─── PDF PAGE CLASSIFICATION ─────────────────────────────────────────────────
 
 AUDITOR_POISON_PHRASES = [
@@ -915,12 +2039,12 @@ def _extract_pl_any_layout(lines: list, page_num: int, log: list) -> dict:
                 continue
             if not any(p in ll for p in patterns):
                 continue
-            cur, sep_q, prior_yr = _get_large_nums_with_fallback(line)
+            cur, prior_yr, sep_q = _get_large_nums_with_fallback(line)
             for offset in [1, 2]:
                 if cur:
                     break
                 if i + offset < len(lines):
-                    cur, sep_q, prior_yr = _get_large_nums_with_fallback(lines[i + offset])
+                    cur, prior_yr, sep_q = _get_large_nums_with_fallback(lines[i + offset])
             if not cur and sep_q:
                 cur = sep_q
                 log.append(f"[{key}] col-1 font-corrupted, using col-2 fallback @ P{page_num}L{i+1}")
@@ -998,12 +2122,14 @@ def _extract_deterministic(raw_bytes: bytes, page_indices: list) -> dict:
         "company_name": "",
         "currency": "INR Crores",
         "period": "",
+        "period_heading": "",
         "prior_period": "",
         "pl": {},
         "ratios": {},
         "segments": {},
         "balance_sheet": {},
         "is_quarterly": True,
+        "consolidated": False,
         "filing_type": "Quarterly",
         "extraction_log": [],
     }
@@ -1033,11 +2159,12 @@ def _extract_deterministic(raw_bytes: bytes, page_indices: list) -> dict:
         result["filing_type"] = "Annual"
 
     period_m = re.search(
-        r"(?:quarter|nine months|year)[\s\w]*ended[\s\w]*(3[01](?:st|nd|rd|th)?\s+(?:dec|sep|mar|jun)['\.\s]*\d{2,4})",
+        r"(quarter|nine months|year)[\s\w]*ended[\s\w]*(3[01](?:st|nd|rd|th)?\s+(?:dec|sep|mar|jun)['\.\s]*\d{2,4})",
         all_text, re.IGNORECASE
     )
     if period_m:
-        result["period"] = period_m.group(1).strip()
+        result["period"] = period_m.group(2).strip()
+        result["period_heading"] = period_m.group(1).lower()
 
     consolidated_pl_pages = []
     ratio_pages = []
@@ -1053,6 +2180,7 @@ def _extract_deterministic(raw_bytes: bytes, page_indices: list) -> dict:
         if is_segment_page and ("ebitda" in t or "segment results" in t):
             segment_pages.append(page_idx)
 
+    result["consolidated"] = bool(consolidated_pl_pages)
     log.append(f"Consol P&L pages: {[p+1 for p in consolidated_pl_pages]}")
     log.append(f"Ratio pages: {[p+1 for p in ratio_pages]}")
 
@@ -1400,7 +2528,7 @@ def _extract_company_name(text: str) -> str:
     return ""
 
 
-def extract_financial_snippet(raw_bytes: bytes, max_chars: int = 60000) -> str:
+def extract_financial_snippet(raw_bytes: bytes, max_chars: int = 60000, facts: Optional[dict] = None) -> str:
     try:
         import pdfplumber as _plumber
         with _plumber.open(io.BytesIO(raw_bytes)) as _chk:
@@ -1428,6 +2556,7 @@ def extract_financial_snippet(raw_bytes: bytes, max_chars: int = 60000) -> str:
 
     try:
         det = _extract_deterministic(raw_bytes, ratios_scan_pages)
+        if facts is not None: facts.update(det)
         verified_block = _build_verified_block(det)
         logger.info(f"Deterministic: pl_keys={list(det['pl'].keys())}, ratio_keys={list(det['ratios'].keys())}")
     except Exception as e:
@@ -1546,7 +2675,8 @@ def _extract_ratios_hint(raw_bytes: bytes, page_indices: list) -> str:
     return "\n".join(lines)
 
 
-def extract_pdf_text(raw_bytes: bytes) -> str:
+def extract_pdf_text(raw_bytes: bytes, facts: Optional[dict] = None) -> str:
+    """Prompt text for a filing PDF. Pass `facts` to also receive the deterministic extraction."""
     try:
         reader    = pypdf.PdfReader(io.BytesIO(raw_bytes))
         num_pages = len(reader.pages)
@@ -1560,7 +2690,7 @@ def extract_pdf_text(raw_bytes: bytes) -> str:
                 "Please download the digital/searchable version from BSE or NSE.")
 
         logger.info(f"PDF validated: {num_pages} pages")
-        return extract_financial_snippet(raw_bytes)
+        return extract_financial_snippet(raw_bytes, facts=facts)
     except ValueError: raise
     except Exception as e:
         logger.error(f"PDF read error: {e}")
@@ -2283,7 +3413,25 @@ def _sync_cloudflare(text: str) -> dict:
 
 
 # ─── MAIN ANALYSIS ORCHESTRATOR ──────────────────────────────────────────────
-async def run_analysis(text: str) -> dict:
+# Count of user-facing LLM runs in progress; background work waits for idle.
+_interactive_analyses = 0
+analysis_idle = asyncio.Event()
+analysis_idle.set()
+
+async def run_analysis(text: str, background: bool = False) -> dict:
+    global _interactive_analyses
+    if background:
+        return await _run_analysis(text)
+    _interactive_analyses += 1
+    analysis_idle.clear()
+    try:
+        return await _run_analysis(text)
+    finally:
+        _interactive_analyses -= 1
+        if not _interactive_analyses: analysis_idle.set()
+
+
+async def _run_analysis(text: str) -> dict:
     if not text or len(text.strip()) < 100:
         raise Exception("PDF extraction returned insufficient text.")
 
@@ -2329,6 +3477,374 @@ async def run_analysis(text: str) -> dict:
     raise Exception(f"All AI providers failed. {error_summary}")
 
 
+# ─── ANALYSIS RESULT STORE ───────────────────────────────────────────────────
+# Result bodies live in analysis_results keyed by the sha256 of their canonical
+# JSON, compressed; the analyses doc keeps only status, a small summary and the
+# result_hash. Identical results (re-runs of the same filing) share one blob.
+try:
+    import zstandard as _zstd
+    _zstd_c, _zstd_d = _zstd.ZstdCompressor(level=9), _zstd.ZstdDecompressor()
+except ImportError:
+    _zstd = None
+
+ANALYSIS_SUMMARY_FIELDS = ("company_name", "health_score", "health_label", "investor_verdict", "currency",
+                           "statement_type", "period")
+
+def _compress(raw: bytes):
+    if _zstd: return _zstd_c.compress(raw), "zstd"
+    return zlib.compress(raw, 9), "zlib"
+
+def _decompress(blob: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        if not _zstd: raise RuntimeError("zstandard is required to read this stored document")
+        return _zstd_d.decompress(blob)
+    if encoding == "zlib": return zlib.decompress(blob)
+    return blob
+
+def _pack_result(payload: dict):
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    blob, encoding = _compress(raw)
+    return hashlib.sha256(raw).hexdigest(), blob, encoding, len(raw)
+
+def _unpack_result(blob: bytes, encoding: str) -> dict:
+    return json.loads(_decompress(blob, encoding))
+
+def _analysis_summary(result: dict) -> dict:
+    return {k: result.get(k) for k in ANALYSIS_SUMMARY_FIELDS if result.get(k) is not None}
+
+async def store_analysis_result(result: dict, screener_meta: Optional[dict] = None) -> str:
+    """Write the result body to the blob store (no-op if already present) and return its hash."""
+    payload = {"result": result}
+    if screener_meta: payload["screener_meta"] = screener_meta
+    digest, blob, encoding, size = _pack_result(payload)
+    now = datetime.utcnow().isoformat()
+    await analysis_results_col.update_one(
+        {"_id": digest},
+        {"$setOnInsert": {"data": Binary(blob), "encoding": encoding, "size": size, "created_at": now},
+         "$set": {"last_used": now}},
+        upsert=True,
+    )
+    return digest
+
+async def complete_analysis(analysis_id: str, result: dict, screener_meta: Optional[dict] = None):
+    digest = await store_analysis_result(result, screener_meta)
+    await analyses_col.update_one(
+        {"analysis_id": analysis_id},
+        {"$set": {"status": "completed", "result_hash": digest, "summary": _analysis_summary(result)},
+         "$unset": {"result": "", "screener_meta": "", "expires_at": ""}},
+    )
+    return digest
+
+async def fail_analysis(analysis_id: str, msg: str):
+    await analyses_col.update_one(
+        {"analysis_id": analysis_id},
+        {"$set": {"status": "failed", "message": msg,
+                  "expires_at": datetime.utcnow() + timedelta(days=ANALYSIS_FAILED_TTL_DAYS)}},
+    )
+
+async def adopt_analysis(analysis_id: str, done: dict) -> Optional[dict]:
+    """Complete `analysis_id` with another analysis's stored result and return the body.
+    Returns None, leaving `analysis_id` untouched, if that result blob is gone."""
+    # touch first: the orphan collector spares recently used blobs
+    touched = await analysis_results_col.update_one(
+        {"_id": done["result_hash"]}, {"$set": {"last_used": datetime.utcnow().isoformat()}})
+    if not touched.matched_count: return None
+    result = (await hydrate_analysis({"result_hash": done["result_hash"]})).get("result")
+    if result is None: return None
+    await analyses_col.update_one({"analysis_id": analysis_id}, {
+        "$set": {"status": "completed", "result_hash": done["result_hash"], "summary": done.get("summary", {})},
+        "$unset": {"result": "", "expires_at": ""}})
+    return result
+
+async def hydrate_analysis(doc: dict) -> dict:
+    """Swap the stored summary for the full result body. Legacy docs that still
+    embed `result` are returned as they are."""
+    doc.pop("_id", None)
+    summary = doc.pop("summary", None)
+    digest  = doc.pop("result_hash", None)
+    if not digest: return doc
+    blob = await analysis_results_col.find_one({"_id": digest})
+    if not blob:
+        logger.error(f"Result blob {digest} missing for analysis {doc.get('analysis_id')}")
+        doc["result"] = summary
+        return doc
+    payload = await asyncio.get_event_loop().run_in_executor(
+        executor, _unpack_result, bytes(blob["data"]), blob.get("encoding", ""))
+    doc["result"] = payload.get("result")
+    if payload.get("screener_meta"): doc["screener_meta"] = payload["screener_meta"]
+    return doc
+
+
+# ─── ANALYSIS RETENTION ──────────────────────────────────────────────────────
+# Hot tier: analyses_col. Failed runs and unfinished guest runs carry an
+# `expires_at` and are dropped by a TTL index. Completed guest runs are deleted
+# once they are ANALYSIS_GUEST_KEEP_DAYS old, never archived. Other completed
+# analyses past their age limit are moved whole into analyses_archive as one
+# compressed document, with the fields the history list needs kept in the
+# clear; reads fall back to it.
+ANALYSIS_FAILED_TTL_DAYS   = int(os.getenv("ANALYSIS_FAILED_TTL_DAYS", "7"))
+ANALYSIS_GUEST_TTL_DAYS    = int(os.getenv("ANALYSIS_GUEST_TTL_DAYS", "1"))
+ANALYSIS_GUEST_KEEP_DAYS   = int(os.getenv("ANALYSIS_GUEST_KEEP_DAYS", "7"))
+ANALYSIS_ARCHIVE_DAYS      = int(os.getenv("ANALYSIS_ARCHIVE_DAYS", "180"))
+_RETENTION_INTERVAL = 6 * 3600
+_RETENTION_BATCH    = 200
+_ORPHAN_GRACE       = timedelta(days=1)   # a freshly stored or reused blob may not be referenced yet
+_ARCHIVE_CLEAR_FIELDS = ("analysis_id", "user_id", "is_guest", "filename", "source", "status",
+                         "created_at", "summary", "result_hash")
+
+def analysis_expiry(user) -> dict:
+    """Extra fields for a new analysis doc: guest runs expire unless they complete."""
+    if user: return {}
+    return {"expires_at": datetime.utcnow() + timedelta(days=ANALYSIS_GUEST_TTL_DAYS)}
+
+async def ensure_retention_indexes():
+    await analyses_col.create_index("expires_at", expireAfterSeconds=0)
+    await analyses_col.create_index("result_hash", sparse=True)
+    await analyses_archive_col.create_index("analysis_id", unique=True)
+    await analyses_archive_col.create_index([("user_id", 1), ("created_at", -1), ("analysis_id", -1)])
+    await analyses_archive_col.create_index("result_hash", sparse=True)
+    await analyses_archive_col.create_index("is_guest", partialFilterExpression={"is_guest": True})
+
+def _archive_doc(doc: dict) -> dict:
+    doc.pop("_id", None)
+    blob, encoding = _compress(json.dumps(doc, separators=(",", ":"), default=str).encode())
+    out = {k: doc[k] for k in _ARCHIVE_CLEAR_FIELDS if k in doc}
+    if "summary" not in out and isinstance(doc.get("result"), dict):
+        out["summary"] = _analysis_summary(doc["result"])
+    out.update({"data": Binary(blob), "encoding": encoding, "archived_at": datetime.utcnow()})
+    return out
+
+async def load_analysis(analysis_id: str) -> Optional[dict]:
+    """Analysis doc from the hot tier, or rehydrated from the archive."""
+    doc = await analyses_col.find_one({"analysis_id": analysis_id})
+    if doc: return doc
+    arc = await analyses_archive_col.find_one({"analysis_id": analysis_id})
+    if not arc: return None
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, _unpack_result, bytes(arc["data"]), arc.get("encoding", ""))
+
+async def _backfill_expiry():
+    """Give pre-retention failed and unfinished guest docs an expiry."""
+    now = datetime.utcnow()
+    await analyses_col.update_many(
+        {"status": "failed", "expires_at": {"$exists": False}},
+        {"$set": {"expires_at": now + timedelta(days=ANALYSIS_FAILED_TTL_DAYS)}})
+    await analyses_col.update_many(
+        {"is_guest": True, "status": {"$ne": "completed"}, "expires_at": {"$exists": False}},
+        {"$set": {"expires_at": now + timedelta(days=ANALYSIS_GUEST_TTL_DAYS)}})
+
+async def _backfill_summaries():
+    """Add summary fields introduced after a doc was completed (statement_type, period)."""
+    from pymongo import UpdateOne
+    query = {"status": "completed", "result_hash": {"$exists": True}, "summary.period": {"$exists": False}}
+    while True:
+        docs = await analyses_col.find(query, {"_id": 1, "result_hash": 1, "summary": 1}).limit(_RETENTION_BATCH).to_list(_RETENTION_BATCH)
+        if not docs: break
+        ops = []
+        for d in docs:
+            result = (await hydrate_analysis({"result_hash": d["result_hash"]})).get("result") or {}
+            summary = {**(d.get("summary") or {}), **_analysis_summary(result)}
+            summary.setdefault("statement_type", ""); summary.setdefault("period", "")
+            ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"summary": summary}}))
+        await analyses_col.bulk_write(ops, ordered=False)
+
+async def drop_old_guest_analyses() -> int:
+    """Delete completed guest runs past ANALYSIS_GUEST_KEEP_DAYS, including any
+    archived before guests stopped being archived; their blobs become orphans."""
+    old = {"is_guest": True, "created_at": {"$lt": (datetime.utcnow() - timedelta(days=ANALYSIS_GUEST_KEEP_DAYS)).isoformat()}}
+    hot = await analyses_col.delete_many({**old, "status": "completed"})
+    arc = await analyses_archive_col.delete_many({"is_guest": True})
+    return hot.deleted_count + arc.deleted_count
+
+async def archive_old_analyses() -> int:
+    query = {"status": "completed", "is_guest": {"$ne": True},
+             "created_at": {"$lt": (datetime.utcnow() - timedelta(days=ANALYSIS_ARCHIVE_DAYS)).isoformat()}}
+    from pymongo import UpdateOne
+    moved = 0
+    while True:
+        docs = await analyses_col.find(query).limit(_RETENTION_BATCH).to_list(_RETENTION_BATCH)
+        if not docs: break
+        ops = [UpdateOne({"analysis_id": d["analysis_id"]}, {"$set": _archive_doc(dict(d))}, upsert=True)
+               for d in docs]
+        await analyses_archive_col.bulk_write(ops, ordered=False)
+        await analyses_col.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        moved += len(docs)
+    return moved
+
+async def collect_orphan_results() -> int:
+    """Drop result blobs no hot or archived analysis points at any more. Blobs stored
+    or adopted within _ORPHAN_GRACE are kept, and the delete re-checks that, so a
+    blob reused while this runs survives."""
+    cutoff = (datetime.utcnow() - _ORPHAN_GRACE).isoformat()
+    stale  = {"created_at": {"$lt": cutoff}, "last_used": {"$not": {"$gte": cutoff}}}
+    refs: set = set()
+    for col in (analyses_col, analyses_archive_col):
+        async for g in col.aggregate([{"$match": {"result_hash": {"$exists": True}}},
+                                      {"$group": {"_id": "$result_hash"}}]):
+            refs.add(g["_id"])
+    removed, batch = 0, []
+    async for blob in analysis_results_col.find(stale, {"_id": 1}):
+        if blob["_id"] in refs: continue
+        batch.append(blob["_id"])
+        if len(batch) >= _RETENTION_BATCH:
+            removed += (await analysis_results_col.delete_many({"_id": {"$in": batch}, **stale})).deleted_count
+            batch = []
+    if batch:
+        removed += (await analysis_results_col.delete_many({"_id": {"$in": batch}, **stale})).deleted_count
+    return removed
+
+async def _retention_loop():
+    while True:
+        try:
+            await _backfill_expiry()
+            await _backfill_summaries()
+            guests   = await drop_old_guest_analyses()
+            archived = await archive_old_analyses()
+            orphans  = await collect_orphan_results()
+            if guests or archived or orphans:
+                logger.info(f"Retention: dropped {guests} guest analyses, archived {archived}, "
+                            f"removed {orphans} orphan results")
+        except Exception as e:
+            logger.error(f"Retention pass failed: {e}")
+        await asyncio.sleep(_RETENTION_INTERVAL)
+
+
+# ─── PRE-ANALYSIS ────────────────────────────────────────────────────────────
+# New result filings for the symbols people are looking at get analysed ahead
+# of the first click. Demand is a decaying score fed by filing views, searches
+# and Screener analyses, topped up by POPULAR_SYMBOLS. Jobs run one at a time,
+# most-demanded first, only while no user analysis is running, and under an
+# hourly cap. Results are stored as ordinary analyses owned by
+# _PREANALYSIS_USER; analyze_from_url reuses any completed analysis of the
+# same pdf_url, or joins a pre-run already in progress.
+PREANALYSIS_MAX_PER_HOUR = int(os.getenv("PREANALYSIS_MAX_PER_HOUR", "20"))   # 0 disables
+_PREANALYSIS_WATCH_TOP   = 50
+_PREANALYSIS_WINDOW      = timedelta(hours=6)
+_PREANALYSIS_POLL        = 60
+_PREANALYSIS_DECAY_EVERY = 6 * 3600
+_PREANALYSIS_USER        = "system:preanalysis"
+_symbol_demand: Counter = Counter()
+_preanalysis_running: dict = {}   # pdf_url -> task
+_preanalysed_at: dict = {}        # symbol -> monotonic time of its last pre-run
+
+
+def note_symbol_demand(symbol: str, weight: float = 1.0):
+    if symbol: _symbol_demand[symbol.upper()] += weight
+
+
+def _watched_symbols() -> dict:
+    watched = {sym: 1.0 for sym in POPULAR_SYMBOLS}
+    for sym, score in _symbol_demand.most_common(_PREANALYSIS_WATCH_TOP):
+        watched[sym] = watched.get(sym, 0) + score
+    return watched
+
+
+async def find_completed_analysis(pdf_url: str) -> Optional[dict]:
+    return await analyses_col.find_one(
+        {"pdf_url": pdf_url, "status": "completed", "result_hash": {"$exists": True}},
+        {"_id": 0, "result_hash": 1, "summary": 1}, sort=[("created_at", -1)])
+
+async def find_recent_screener_analysis(symbol: str, consolidated: bool, since: datetime) -> Optional[dict]:
+    return await analyses_col.find_one(
+        {"symbol": symbol, "source": "screener", "consolidated": consolidated, "status": "completed",
+         "created_at": {"$gte": since.isoformat()}, "result_hash": {"$exists": True}},
+        {"_id": 0, "result_hash": 1, "summary": 1}, sort=[("created_at", -1)])
+
+
+class _PreAnalysisQueue:
+    def __init__(self):
+        self._heap: list = []
+        self._queued: set = set()
+        self._seq = itertools.count()
+        self._started: list = []   # monotonic start times within the last hour
+
+    def push(self, filing: dict, score: float):
+        # One pre-run per symbol: NSE and BSE list the same results under different URLs.
+        if filing["symbol"] in self._queued: return
+        self._queued.add(filing["symbol"])
+        heapq.heappush(self._heap, (-score, next(self._seq), filing))
+
+    def pop(self) -> Optional[dict]:
+        if not self._heap: return None
+        filing = heapq.heappop(self._heap)[2]
+        self._queued.discard(filing["symbol"])
+        return filing
+
+    def budget_left(self) -> bool:
+        now = time.monotonic()
+        self._started = [t for t in self._started if now - t < 3600]
+        return len(self._started) < PREANALYSIS_MAX_PER_HOUR
+
+    def note_started(self):
+        self._started.append(time.monotonic())
+
+    def __len__(self):
+        return len(self._heap)
+
+
+_preanalysis_queue = _PreAnalysisQueue()
+
+
+async def _discover_new_results():
+    watched = _watched_symbols()
+    since   = datetime.utcnow() - _PREANALYSIS_WINDOW
+    async for f in filings_col.find(
+            {"symbol": {"$in": list(watched)}, "discovered_at": {"$gte": since}, "type": {"$regex": "Results"}},
+            {"_id": 0, "symbol": 1, "pdf_url": 1, "source": 1, "title": 1}):
+        if time.monotonic() - _preanalysed_at.get(f["symbol"], -1e9) < _PREANALYSIS_WINDOW.total_seconds(): continue
+        if await analyses_col.find_one({"pdf_url": f["pdf_url"]}, {"_id": 1}): continue
+        _preanalysis_queue.push(f, watched.get(f["symbol"], 0))
+
+
+async def _preanalyse(filing: dict):
+    analysis_id = str(uuid.uuid4())
+    await analyses_col.insert_one({"analysis_id": analysis_id, "user_id": _PREANALYSIS_USER, "is_guest": False,
+        "filename": filing.get("title") or filing["symbol"], "source": filing["source"].lower(),
+        "pdf_url": filing["pdf_url"], "status": "processing", "created_at": datetime.utcnow().isoformat(),
+        "result": None, "preanalysis": True})
+    try:
+        content = await fetch_filing_pdf(filing["pdf_url"], filing["source"].lower())
+        await analysis_idle.wait()
+        det  = {}
+        text = await asyncio.get_event_loop().run_in_executor(executor, extract_pdf_text, content, det)
+        await record_filing_facts(det, filing["symbol"], filing["source"], filing["pdf_url"], analysis_id)
+        await analysis_idle.wait()
+        result = await run_analysis(text, background=True)
+        await complete_analysis(analysis_id, result)
+        logger.info(f"Pre-analysed {filing['symbol']}: {filing['pdf_url']}")
+    except Exception as e:
+        logger.warning(f"Pre-analysis failed for {filing['pdf_url']}: {e}")
+        await fail_analysis(analysis_id, str(e))
+
+
+async def _preanalysis_loop():
+    last_decay = time.monotonic()
+    while True:
+        await asyncio.sleep(_PREANALYSIS_POLL)
+        if PREANALYSIS_MAX_PER_HOUR <= 0: continue
+        try:
+            if time.monotonic() - last_decay > _PREANALYSIS_DECAY_EVERY:
+                for sym in list(_symbol_demand):
+                    _symbol_demand[sym] /= 2
+                    if _symbol_demand[sym] < 0.5: del _symbol_demand[sym]
+                last_decay = time.monotonic()
+            await _discover_new_results()
+            while len(_preanalysis_queue) and _preanalysis_queue.budget_left():
+                await analysis_idle.wait()
+                filing = _preanalysis_queue.pop()
+                if await analyses_col.find_one({"pdf_url": filing["pdf_url"]}, {"_id": 1}): continue
+                _preanalysis_queue.note_started()
+                _preanalysed_at[filing["symbol"]] = time.monotonic()
+                task = asyncio.create_task(_preanalyse(filing))
+                _preanalysis_running[filing["pdf_url"]] = task
+                try:
+                    await asyncio.shield(task)
+                finally:
+                    _preanalysis_running.pop(filing["pdf_url"], None)
+        except Exception as e:
+            logger.error(f"Pre-analysis pass failed: {e}")
+
+
 # ─── FMP HELPERS ─────────────────────────────────────────────────────────────
 _fmp_cache: dict = {}
 _FMP_CACHE_TTL   = 300
@@ -2363,21 +3879,168 @@ def _fmt_cr(val) -> str:
     except: return str(val) if val else "N/A"
 
 
-async def _fmp_get(endpoint: str, params: dict = None) -> dict:
+# ─── FMP REQUEST SCHEDULER ───────────────────────────────────────────────────
+# Every FMP call goes through one token bucket. Waiters are served by priority
+# class (interactive before background), FIFO within a class; background work
+# may not spend the last slice of the daily quota. Identical in-flight requests
+# share one upstream call, which runs at the most urgent priority of its callers.
+FMP_PRIORITY_INTERACTIVE = 0
+FMP_PRIORITY_BACKGROUND  = 1
+_FMP_BACKGROUND_RESERVE  = 0.1
+_FMP_MAX_ATTEMPTS        = 3
+
+
+class _FmpScheduler:
+    def __init__(self, rate_per_min: int, burst: int, daily_quota: int):
+        self.rate        = max(rate_per_min, 1) / 60.0
+        self.capacity    = float(max(burst, 1))
+        self.tokens      = self.capacity
+        self.daily_quota = daily_quota
+        self.day         = datetime.utcnow().date()
+        self.used_today  = 0
+        self.exhausted_day   = None
+        self.backoff_until   = 0.0
+        self.backoff_secs    = 0.0
+        self.throttled_total = 0
+        self.coalesced_total = 0
+        self._updated = time.monotonic()
+        self._waiters: list = []
+        self._seq  = itertools.count()
+        self._pump = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens   = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        today = datetime.utcnow().date()
+        if today != self.day:
+            self.day, self.used_today = today, 0
+
+    def remaining_today(self):
+        if self.exhausted_day == self.day: return 0
+        if not self.daily_quota: return None
+        return max(self.daily_quota - self.used_today, 0)
+
+    async def acquire(self, call: "_FmpCall"):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (call.priority, next(self._seq), fut))
+        call.waiting = fut
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await fut
+
+    def promote(self, call: "_FmpCall", priority: int):
+        """Raise a shared call's priority; a queued wait is re-queued and its old entry skipped."""
+        if priority >= call.priority: return
+        call.priority = priority
+        if call.waiting is not None and not call.waiting.done():
+            heapq.heappush(self._waiters, (priority, next(self._seq), call.waiting))
+
+    def _fail_head(self, msg: str):
+        _, _, fut = heapq.heappop(self._waiters)
+        if not fut.done(): fut.set_exception(Exception(msg))
+
+    async def _run(self):
+        while self._waiters:
+            self._refill()
+            priority, _, fut = self._waiters[0]
+            if fut.done():   # caller cancelled
+                heapq.heappop(self._waiters); continue
+            remaining = self.remaining_today()
+            if remaining == 0:
+                self._fail_head("FMP daily quota exhausted — resets at 00:00 UTC"); continue
+            if (priority > FMP_PRIORITY_INTERACTIVE and remaining is not None
+                    and remaining <= self.daily_quota * _FMP_BACKGROUND_RESERVE):
+                self._fail_head("FMP quota reserved for interactive requests"); continue
+            wait = self.backoff_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait); continue
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate); continue
+            heapq.heappop(self._waiters)
+            self.tokens     -= 1
+            self.used_today += 1
+            fut.set_result(None)
+
+    def note_throttled(self, retry_after: Optional[str]):
+        self.throttled_total += 1
+        self.backoff_secs = min(max(self.backoff_secs * 2, 2.0), 60.0)
+        try: delay = float(retry_after) if retry_after else self.backoff_secs
+        except ValueError: delay = self.backoff_secs
+        self.backoff_until = max(self.backoff_until, time.monotonic() + delay)
+        self.tokens = 0.0
+        logger.warning(f"FMP throttled (429) — backing off {delay:.0f}s")
+
+    def note_quota_exhausted(self):
+        self.exhausted_day = datetime.utcnow().date()
+        logger.warning("FMP reports daily limit reached — failing FMP calls until 00:00 UTC")
+
+    def note_success(self):
+        self.backoff_secs = 0.0
+
+    def status(self) -> dict:
+        self._refill()
+        return {"rate_per_min": round(self.rate * 60), "tokens_available": int(self.tokens),
+                "daily_quota": self.daily_quota or None, "used_today": self.used_today,
+                "remaining_today": self.remaining_today(), "queued": len(self._waiters),
+                "backoff_seconds": round(max(self.backoff_until - time.monotonic(), 0), 1),
+                "throttled_total": self.throttled_total, "coalesced_total": self.coalesced_total}
+
+
+class _FmpCall:
+    """One upstream request, shared by every caller that asked for the same URL."""
+    __slots__ = ("priority", "waiting", "task")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.waiting  = None   # scheduler future while queued for a token
+        self.task     = None
+
+
+_fmp_scheduler = _FmpScheduler(FMP_RATE_PER_MIN, FMP_BURST, FMP_DAILY_QUOTA)
+_fmp_inflight: dict = {}   # request key -> _FmpCall
+
+
+async def _fmp_request(endpoint: str, params: dict, call: _FmpCall):
+    p = {"apikey": FMP_API_KEY, **(params or {})}
+    for _ in range(_FMP_MAX_ATTEMPTS):
+        await _fmp_scheduler.acquire(call)
+        async with httpx.AsyncClient(timeout=20) as c:
+            r = await c.get(f"{FMP_BASE}{endpoint}", params=p)
+        if r.status_code == 429:
+            if "limit reach" in r.text.lower():
+                _fmp_scheduler.note_quota_exhausted()
+                raise Exception("FMP daily quota exhausted — resets at 00:00 UTC")
+            _fmp_scheduler.note_throttled(r.headers.get("Retry-After"))
+            continue
+        _fmp_scheduler.note_success()
+        if r.status_code != 200:
+            raise Exception(f"FMP API error {r.status_code}: {r.text[:200]}")
+        data = r.json()
+        if isinstance(data, dict) and "Error Message" in data:
+            if "limit reach" in str(data["Error Message"]).lower():
+                _fmp_scheduler.note_quota_exhausted()
+            raise Exception(f"FMP error: {data['Error Message']}")
+        return data
+    raise Exception(f"FMP API rate limited (429) after {_FMP_MAX_ATTEMPTS} attempts")
+
+
+async def _fmp_get(endpoint: str, params: dict = None, priority: int = FMP_PRIORITY_INTERACTIVE) -> dict:
     if not FMP_API_KEY:
         raise Exception("FMP_API_KEY not configured")
-    p = {"apikey": FMP_API_KEY, **(params or {})}
-    async with httpx.AsyncClient(timeout=20) as c:
-        r = await c.get(f"{FMP_BASE}{endpoint}", params=p)
-    if r.status_code != 200:
-        raise Exception(f"FMP API error {r.status_code}: {r.text[:200]}")
-    data = r.json()
-    if isinstance(data, dict) and "Error Message" in data:
-        raise Exception(f"FMP error: {data['Error Message']}")
-    return data
+    key  = f"{endpoint}?{urlencode(sorted((params or {}).items()))}"
+    call = _fmp_inflight.get(key)
+    if call is None:
+        call = _fmp_inflight[key] = _FmpCall(priority)
+        call.task = asyncio.create_task(_fmp_request(endpoint, params, call))
+        call.task.add_done_callback(lambda _t: _fmp_inflight.pop(key, None))
+    else:
+        _fmp_scheduler.coalesced_total += 1
+        _fmp_scheduler.promote(call, priority)
+    return await asyncio.shield(call.task)
 
 
-async def get_fmp_quote(symbol: str) -> dict:
+async def get_fmp_quote(symbol: str, priority: int = FMP_PRIORITY_INTERACTIVE) -> dict:
     sym = symbol.upper().strip()
     cached = _fmp_cached(f"quote:{sym}")
     if cached:
@@ -2388,9 +4051,9 @@ async def get_fmp_quote(symbol: str) -> dict:
 
     try:
         quote_data, profile_data, ratio_data = await asyncio.gather(
-            _fmp_get(f"/v3/quote/{fmp_sym}"),
-            _fmp_get(f"/v3/profile/{fmp_sym}"),
-            _fmp_get(f"/v3/ratios-ttm/{fmp_sym}"),
+            _fmp_get(f"/v3/quote/{fmp_sym}", priority=priority),
+            _fmp_get(f"/v3/profile/{fmp_sym}", priority=priority),
+            _fmp_get(f"/v3/ratios-ttm/{fmp_sym}", priority=priority),
             return_exceptions=True
         )
 
@@ -2464,6 +4127,253 @@ async def get_fmp_quote(symbol: str) -> dict:
         raise Exception(f"FMP quote failed for {sym}: {str(e)}")
 
 
+# ─── PRICE HISTORY STORE ─────────────────────────────────────────────────────
+# One array-backed OHLCV series per FMP symbol, oldest bar first. Every history
+# period is served by slicing the tail of the same arrays; refreshes only ask FMP
+# for bars after the last stored date. The least recently used series are
+# dropped past _HISTORY_CACHE_MAX (a full series is ~90 KB).
+_HISTORY_MAX_BARS    = 1825
+_HISTORY_REFRESH_TTL = 300
+_HISTORY_CACHE_MAX   = 500
+_HISTORY_PERIODS     = {"1m": 30, "3m": 90, "6m": 180, "1y": 365, "3y": 1095, "5y": 1825}
+
+
+class _PriceSeries:
+    __slots__ = ("dates", "open", "high", "low", "close", "volume", "refreshed_at", "lock")
+
+    def __init__(self):
+        self.dates  = np.empty(0, dtype="datetime64[D]")
+        self.open   = np.empty(0, dtype=np.float64)
+        self.high   = np.empty(0, dtype=np.float64)
+        self.low    = np.empty(0, dtype=np.float64)
+        self.close  = np.empty(0, dtype=np.float64)
+        self.volume = np.empty(0, dtype=np.float64)
+        self.refreshed_at = None
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def is_fresh(self) -> bool:
+        return (self.refreshed_at is not None and
+                (datetime.utcnow() - self.refreshed_at).total_seconds() < _HISTORY_REFRESH_TTL)
+
+    def merge(self, bars: list):
+        """Append FMP bars (any order). A bar dated on/before the last stored bar replaces it."""
+        if not bars:
+            return
+        rows = sorted((b for b in bars if b.get("date")), key=lambda b: b["date"])
+        if not rows:
+            return
+        dates = np.array([b["date"][:10] for b in rows], dtype="datetime64[D]")
+
+        def _col(field):
+            return np.array([np.nan if b.get(field) is None else float(b[field]) for b in rows], dtype=np.float64)
+
+        if len(self.dates):
+            keep = self.dates < dates[0]
+            self.dates  = np.concatenate([self.dates[keep],  dates])
+            self.open   = np.concatenate([self.open[keep],   _col("open")])
+            self.high   = np.concatenate([self.high[keep],   _col("high")])
+            self.low    = np.concatenate([self.low[keep],    _col("low")])
+            self.close  = np.concatenate([self.close[keep],  _col("close")])
+            self.volume = np.concatenate([self.volume[keep], _col("volume")])
+        else:
+            self.dates, self.open, self.high = dates, _col("open"), _col("high")
+            self.low, self.close, self.volume = _col("low"), _col("close"), _col("volume")
+
+        if len(self.dates) > _HISTORY_MAX_BARS:
+            cut = len(self.dates) - _HISTORY_MAX_BARS
+            for name in ("dates", "open", "high", "low", "close", "volume"):
+                setattr(self, name, getattr(self, name)[cut:])
+
+    def tail(self, bars: int) -> dict:
+        """Return views over the last `bars` bars (no copies)."""
+        n = min(bars, len(self.dates))
+        return {"dates": self.dates[-n:], "open": self.open[-n:], "high": self.high[-n:],
+                "low": self.low[-n:], "close": self.close[-n:], "volume": self.volume[-n:]}
+
+
+_price_history: "OrderedDict[str, _PriceSeries]" = OrderedDict()
+
+
+async def get_price_history(fmp_sym: str) -> _PriceSeries:
+    """Return the stored series for `fmp_sym`, fetching 5y on first use and only new bars afterwards."""
+    series = _price_history.get(fmp_sym)
+    if series is None:
+        series = _price_history[fmp_sym] = _PriceSeries()
+        while len(_price_history) > _HISTORY_CACHE_MAX: _price_history.popitem(last=False)
+    else:
+        _price_history.move_to_end(fmp_sym)
+    if series.is_fresh():
+        return series
+
+    async with series.lock:
+        if series.is_fresh():
+            return series
+        if len(series):
+            params = {"from": np.datetime_as_string(series.dates[-1], unit="D")}
+        else:
+            params = {"timeseries": _HISTORY_MAX_BARS}
+        data = await _fmp_get(f"/v3/historical-price-full/{fmp_sym}", params)
+        bars = data.get("historical") if isinstance(data, dict) else None
+        series.merge(bars or [])
+        series.refreshed_at = datetime.utcnow()
+        logger.info(f"Price history {fmp_sym}: {len(bars or [])} bars fetched, {len(series)} stored")
+    return series
+
+
+# ─── TECHNICAL INDICATORS ────────────────────────────────────────────────────
+# Computed from the price history store for a whole watchlist at once: closes are
+# aligned into a (symbols x bars) matrix and every indicator is a column-wise
+# NumPy reduction over it.
+_NIFTY_FMP_SYMBOL = "^NSEI"
+_TRADING_DAYS     = 252
+_RSI_PERIOD       = 14
+_BETA_MIN_OBS     = 60
+
+
+def _align_closes(series_list: list) -> tuple:
+    """Align closes on the union of all dates. Returns (dates, closes, traded): prices are
+    forward-filled across gaps (leading bars of late listings stay NaN), and `traded`
+    marks the bars a symbol actually printed, so returns never span a filled day."""
+    all_dates = np.unique(np.concatenate([s.dates for s in series_list]))
+    mat = np.full((len(series_list), len(all_dates)), np.nan)
+    for i, s in enumerate(series_list):
+        mat[i, np.searchsorted(all_dates, s.dates)] = s.close
+    traded = ~np.isnan(mat)
+    pos = np.where(traded, np.arange(mat.shape[1]), 0)
+    np.maximum.accumulate(pos, axis=1, out=pos)
+    return all_dates, mat[np.arange(mat.shape[0])[:, None], pos], traded
+
+
+def _pair_log_returns(log_c: np.ndarray, traded: np.ndarray, log_b: np.ndarray, b_traded: np.ndarray) -> tuple:
+    """Log returns of every row and of the benchmark between consecutive dates on which
+    both traded (NaN elsewhere), so both legs of each pair cover the same span."""
+    n, t = log_c.shape
+    both = traded & b_traded
+    last = np.maximum.accumulate(np.where(both, np.arange(t), -1), axis=1)
+    prev = np.concatenate([np.full((n, 1), -1), last[:, :-1]], axis=1)
+    ok   = both & (prev >= 0)
+    prev = np.maximum(prev, 0)
+    rs = np.where(ok, log_c - log_c[np.arange(n)[:, None], prev], np.nan)
+    rb = np.where(ok, log_b - log_b[prev], np.nan)
+    return rs, rb
+
+
+def _compute_indicators(closes: np.ndarray, traded: np.ndarray, bench: Optional[np.ndarray] = None,
+                        bench_traded: Optional[np.ndarray] = None) -> List[dict]:
+    """Indicator snapshot for every row of `closes` (symbols x bars, oldest first, as
+    returned by _align_closes). Return-based stats skip bars a symbol didn't trade."""
+    n, t = closes.shape
+    nan_col = np.full(n, np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        last = closes[:, -1]
+
+        def _ret(bars):
+            return (last / closes[:, -1 - bars] - 1) * 100 if t > bars else nan_col
+
+        log_c   = np.log(closes)
+        log_ret = np.where(traded[:, 1:], np.diff(log_c, axis=1), np.nan)
+        printed = np.where(traded, closes, np.nan)
+
+        def _vol(window):
+            if log_ret.shape[1] < window: return nan_col
+            return np.nanstd(log_ret[:, -window:], axis=1, ddof=1) * np.sqrt(_TRADING_DAYS) * 100
+
+        def _sma(window):
+            return np.nanmean(printed[:, -window:], axis=1) if t >= window else nan_col
+
+        drawdown = closes / np.fmax.accumulate(closes, axis=1) - 1
+        dd_1y    = closes[:, -_TRADING_DAYS:] / np.fmax.accumulate(closes[:, -_TRADING_DAYS:], axis=1) - 1
+
+        # Wilder RSI: recursive in time, vectorised across symbols. Each row seeds on
+        # its own first _RSI_PERIOD traded bars in the window and skips untraded ones.
+        delta = np.where(traded[:, 1:], np.diff(closes, axis=1), np.nan)[:, -(_TRADING_DAYS + _RSI_PERIOD):]
+        valid = ~np.isnan(delta)
+        gain, loss = np.clip(np.nan_to_num(delta), 0, None), np.clip(-np.nan_to_num(delta), 0, None)
+        seen = np.zeros(n, dtype=np.int64)
+        avg_g, avg_l = np.zeros(n), np.zeros(n)
+        for i in range(delta.shape[1]):
+            v = valid[:, i]
+            seeding, rolling = v & (seen < _RSI_PERIOD), v & (seen >= _RSI_PERIOD)
+            avg_g = np.where(seeding, avg_g + gain[:, i] / _RSI_PERIOD,
+                             np.where(rolling, (avg_g * (_RSI_PERIOD - 1) + gain[:, i]) / _RSI_PERIOD, avg_g))
+            avg_l = np.where(seeding, avg_l + loss[:, i] / _RSI_PERIOD,
+                             np.where(rolling, (avg_l * (_RSI_PERIOD - 1) + loss[:, i]) / _RSI_PERIOD, avg_l))
+            seen += v
+        rsi = np.where(seen < _RSI_PERIOD, np.nan, np.where(avg_l == 0, 100.0, 100 - 100 / (1 + avg_g / avg_l)))
+
+        beta, corr = nan_col, nan_col
+        if bench is not None and t > 1:
+            rs, rb = _pair_log_returns(log_c, traded, np.log(bench), bench_traded)
+            rs, rb = rs[:, -_TRADING_DAYS:], rb[:, -_TRADING_DAYS:]
+            mask = ~np.isnan(rs) & ~np.isnan(rb)
+            obs = mask.sum(axis=1)
+            rs_m, rb_m = np.where(mask, rs, np.nan), np.where(mask, rb, np.nan)
+            ds = rs_m - np.nanmean(rs_m, axis=1, keepdims=True)
+            db = rb_m - np.nanmean(rb_m, axis=1, keepdims=True)
+            cov, var_b, var_s = np.nanmean(ds * db, axis=1), np.nanmean(db * db, axis=1), np.nanmean(ds * ds, axis=1)
+            beta = np.where(obs >= _BETA_MIN_OBS, cov / var_b, np.nan)
+            corr = np.where(obs >= _BETA_MIN_OBS, cov / np.sqrt(var_b * var_s), np.nan)
+
+        sma20, sma50, sma200 = _sma(20), _sma(50), _sma(200)
+        cols = {
+            "price":               last,
+            "return_1d_pct":       _ret(1),
+            "return_1w_pct":       _ret(5),
+            "return_1m_pct":       _ret(21),
+            "return_3m_pct":       _ret(63),
+            "return_6m_pct":       _ret(126),
+            "return_1y_pct":       _ret(_TRADING_DAYS),
+            "volatility_20d_pct":  _vol(20),
+            "volatility_60d_pct":  _vol(60),
+            "volatility_1y_pct":   _vol(_TRADING_DAYS),
+            "drawdown_pct":        drawdown[:, -1] * 100,
+            "max_drawdown_1y_pct": np.nanmin(dd_1y, axis=1) * 100,
+            "max_drawdown_pct":    np.nanmin(drawdown, axis=1) * 100,
+            "sma_20":              sma20,
+            "sma_50":              sma50,
+            "sma_200":             sma200,
+            "price_vs_sma50_pct":  (last / sma50 - 1) * 100,
+            "price_vs_sma200_pct": (last / sma200 - 1) * 100,
+            "rsi_14":              rsi,
+            "beta_nifty":          beta,
+            "correlation_nifty":   corr,
+        }
+
+    out = [{} for _ in range(n)]
+    for key, arr in cols.items():
+        for row, v in zip(out, arr.tolist()):
+            row[key] = None if v != v or v in (float("inf"), float("-inf")) else round(v, 2)
+    return out
+
+
+async def compute_watchlist_indicators(symbols: List[str]) -> tuple:
+    """Fetch (cached) histories for `symbols` plus Nifty and compute all indicators in one pass."""
+    fmp_syms = [_fmp_symbol(s) for s in symbols]
+    fetched  = await asyncio.gather(*[get_price_history(f) for f in fmp_syms + [_NIFTY_FMP_SYMBOL]],
+                                    return_exceptions=True)
+    bench = fetched[-1] if isinstance(fetched[-1], _PriceSeries) and len(fetched[-1]) else None
+    if bench is None:
+        logger.warning(f"Nifty history unavailable — beta not computed: {fetched[-1]}")
+
+    ok, errors = [], {}
+    for sym, s in zip(symbols, fetched[:-1]):
+        if isinstance(s, _PriceSeries) and len(s): ok.append((sym, s))
+        else: errors[sym] = str(s) if isinstance(s, Exception) else "No price history"
+    if not ok:
+        return {}, errors
+
+    series = [s for _, s in ok] + ([bench] if bench else [])
+    dates, closes, traded = _align_closes(series)
+    stats = _compute_indicators(closes[:len(ok)], traded[:len(ok)],
+                                closes[-1] if bench else None, traded[-1] if bench else None)
+    as_of = str(np.datetime_as_string(dates[-1], unit="D"))
+    return {sym: {"symbol": sym, "as_of": as_of, **row} for (sym, _), row in zip(ok, stats)}, errors
+
+
 # ─── ROUTES ──────────────────────────────────────────────────────────────────
 @app.get("/api/health")
 async def health():
@@ -2474,6 +4384,8 @@ async def health():
             "cloudflare":  bool(os.getenv("CF_API_TOKEN")),
             "openrouter":  bool(os.getenv("OPENROUTER_API_KEY")),
             "fmp":         bool(FMP_API_KEY),
+            "fmp_budget":  _fmp_scheduler.status(),
+            "exchange_sessions": {k: v.status() for k, v in EXCHANGE_SESSIONS.items()},
             "companies_in_db": company_count}
 
 
@@ -2497,26 +4409,56 @@ async def get_quote_history(symbol: str, period: str = "1y"):
 
     sym     = symbol.upper().strip()
     fmp_sym = _fmp_symbol(sym)
-    period_map = {"1m": 30, "3m": 90, "6m": 180, "1y": 365, "3y": 1095, "5y": 1825}
-    if period not in period_map:
-        raise HTTPException(400, f"Invalid period. Valid: {list(period_map.keys())}")
-
-    cache_key = f"history:{sym}:{period}"
-    cached = _fmp_cached(cache_key)
-    if cached:
-        return cached
+    if period not in _HISTORY_PERIODS:
+        raise HTTPException(400, f"Invalid period. Valid: {list(_HISTORY_PERIODS.keys())}")
 
     try:
-        data = await _fmp_get(f"/v3/historical-price-full/{fmp_sym}", {"timeseries": period_map[period]})
-        records = [{"date": d.get("date"), "open": _safe(d.get("open")), "high": _safe(d.get("high")),
-                    "low": _safe(d.get("low")), "close": _safe(d.get("close")), "volume": d.get("volume")}
-                   for d in (data.get("historical") or [])]
-        result = {"symbol": sym, "fmp_symbol": fmp_sym, "period": period, "count": len(records),
-                  "data": records, "fetched_at": datetime.utcnow().isoformat() + "Z"}
-        return _fmp_store(cache_key, result)
+        series = await get_price_history(fmp_sym)
     except Exception as e:
         raise HTTPException(404, str(e))
 
+    t = series.tail(_HISTORY_PERIODS[period])
+    dates = np.datetime_as_string(t["dates"][::-1], unit="D").tolist()
+
+    def _col(arr):
+        return [None if v != v else round(v, 2) for v in arr[::-1].tolist()]
+
+    opens, highs, lows, closes = _col(t["open"]), _col(t["high"]), _col(t["low"]), _col(t["close"])
+    volumes = [None if v != v else int(v) for v in t["volume"][::-1].tolist()]
+    records = [{"date": d, "open": o, "high": h, "low": l, "close": c, "volume": v}
+               for d, o, h, l, c, v in zip(dates, opens, highs, lows, closes, volumes)]
+    return {"symbol": sym, "fmp_symbol": fmp_sym, "period": period, "count": len(records),
+            "data": records, "fetched_at": series.refreshed_at.isoformat() + "Z"}
+
+
+@app.get("/api/quote/{symbol}/indicators")
+async def get_quote_indicators(symbol: str):
+    if not FMP_API_KEY:
+        raise HTTPException(503, "FMP_API_KEY not configured on server")
+    sym = symbol.upper().strip()
+    results, errors = await compute_watchlist_indicators([sym])
+    if sym not in results:
+        raise HTTPException(404, errors.get(sym, f"No price history for {sym}"))
+    return {**results[sym], "benchmark": "Nifty 50", "fetched_at": datetime.utcnow().isoformat() + "Z"}
+
+
+@app.post("/api/quotes/indicators")
+async def get_batch_indicators(body: dict):
+    symbols: list = body.get("symbols", [])
+    if not symbols or not isinstance(symbols, list):
+        raise HTTPException(400, 'Body must be { "symbols": ["SYM1", ...] }')
+    if len(symbols) > 50:
+        raise HTTPException(400, "Maximum 50 symbols per batch")
+    if not FMP_API_KEY:
+        raise HTTPException(503, "FMP_API_KEY not configured on server")
+
+    syms = list(dict.fromkeys(s.upper().strip() for s in symbols if isinstance(s, str) and s.strip()))
+    results, errors = await compute_watchlist_indicators(syms)
+    for s, err in errors.items():
+        results[s] = {"symbol": s, "error": err, "status": "failed"}
+    return {"count": len(results), "benchmark": "Nifty 50", "results": results,
+            "fetched_at": datetime.utcnow().isoformat() + "Z"}
+
 
 @app.get("/api/quote/{symbol}/financials")
 async def get_financials(symbol: str):
@@ -2584,7 +4526,7 @@ async def get_market_movers():
     ]
 
     async def _safe_quote(sym):
-        try: return await get_fmp_quote(sym)
+        try: return await get_fmp_quote(sym, priority=FMP_PRIORITY_BACKGROUND)
         except: return None
 
     results = await asyncio.gather(*[_safe_quote(s) for s in NIFTY50])
@@ -2608,7 +4550,9 @@ async def trigger_sync():
 async def sync_status():
     count  = await companies_col.count_documents({})
     latest = await companies_col.find_one({}, sort=[("updated_at", -1)])
-    return {"total_companies": count, "last_updated": latest.get("updated_at") if latest else None}
+    syncs  = {m.pop("_id"): m async for m in sync_meta_col.find({})}
+    return {"total_companies": count, "last_updated": latest.get("updated_at") if latest else None,
+            "last_syncs": syncs}
 
 @app.post("/api/auth/register")
 async def register(req: RegisterRequest):
@@ -2619,7 +4563,7 @@ async def register(req: RegisterRequest):
     if await users_col.find_one({"email": email}): raise HTTPException(400, "Email already registered — please sign in")
     uid = str(uuid.uuid4())
     await users_col.insert_one({"user_id": uid, "name": req.name.strip(), "email": email,
-        "password": hash_pw(req.password), "created_at": datetime.utcnow().isoformat()})
+        "password": await hash_pw(req.password), "created_at": datetime.utcnow().isoformat()})
     return {"token": create_token(uid), "user_id": uid, "name": req.name.strip(), "email": email}
 
 @app.post("/api/auth/login")
@@ -2628,7 +4572,7 @@ async def login(req: LoginRequest):
     email = req.email.strip().lower()
     user  = await users_col.find_one({"email": email})
     if not user: raise HTTPException(401, "No account with this email. Please register first.")
-    if not verify_pw(req.password, user["password"]): raise HTTPException(401, "Incorrect password")
+    if not await verify_pw(req.password, user["password"]): raise HTTPException(401, "Incorrect password")
     return {"token": create_token(user["user_id"]), "user_id": user["user_id"], "name": user["name"], "email": user["email"]}
 
 @app.get("/api/auth/me")
@@ -2639,49 +4583,40 @@ async def me(user=Depends(get_current_user)):
 async def nse_search(q: str = ""):
     if not q.strip(): return {"results": [], "query": ""}
     results = await search_companies(q, limit=15)
+    if results: note_symbol_demand(results[0].get("symbol"), 0.25)
     return {"results": results, "query": q, "total": len(results)}
 
 @app.get("/api/nse/popular")
 async def nse_popular():
-    popular = ["RELIANCE","TCS","HDFCBANK","INFY","ICICIBANK","SBIN",
-               "BAJFINANCE","ZOMATO","LT","WIPRO","ADANIENT","TATAMOTORS","HINDUNILVR","ITC","AXISBANK"]
-    results = []
-    for sym in popular:
-        doc = await companies_col.find_one({"symbol": sym})
-        if doc: doc.pop("_id", None); results.append(doc)
-    return {"results": results}
+    docs = await company_repo.get_many(POPULAR_SYMBOLS, fields=COMPANY_LIST_FIELDS)
+    return {"results": [docs[sym] for sym in POPULAR_SYMBOLS if sym in docs]}
+
+
+@app.post("/api/companies/batch")
+async def get_companies_batch(body: dict):
+    symbols: list = body.get("symbols", [])
+    if not symbols or not isinstance(symbols, list):
+        raise HTTPException(400, 'Body must be { "symbols": ["SYM1", ...] }')
+    if len(symbols) > 100:
+        raise HTTPException(400, "Maximum 100 symbols per batch")
+    syms = [s.upper().strip() for s in symbols if isinstance(s, str) and s.strip()]
+    docs = await company_repo.get_many(syms, fields=COMPANY_LIST_FIELDS)
+    return {"results": [docs[s] for s in dict.fromkeys(syms) if s in docs],
+            "missing": [s for s in dict.fromkeys(syms) if s not in docs]}
 
 @app.get("/api/filings/{symbol}")
 async def get_filings(symbol: str):
     symbol  = symbol.upper().strip()
-    company = await companies_col.find_one({"symbol": symbol})
+    company = await company_repo.get(symbol, fields=("name", "sector", "isin", "bse_code", "filings_indexed_at"))
     if not company:
         raise HTTPException(404, f"Company '{symbol}' not found. Try /api/nse/search?q={symbol}")
 
-    bse_code = company.get("bse_code", "")
-    results  = await asyncio.gather(
-        fetch_nse_filings(symbol),
-        fetch_bse_filings(bse_code, symbol) if bse_code else asyncio.sleep(0),
-        return_exceptions=True)
-    nse_filings = results[0] if isinstance(results[0], list) else []
-    bse_filings = results[1] if isinstance(results[1], list) else []
-
-    all_filings = bse_filings + nse_filings
-    seen: set = set()
-    unique: List[dict] = []
-    for f in all_filings:
-        key = f["title"][:40].lower()
-        if key not in seen: seen.add(key); unique.append(f)
-
-    def _parse_date(d):
-        for fmt in ["%d %b %Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%b %d, %Y", "%Y%m%d"]:
-            try: return datetime.strptime((d or "").strip(), fmt)
-            except: pass
-        return datetime.min
-
-    unique.sort(key=lambda x: _parse_date(x.get("date", "")), reverse=True)
+    note_symbol_demand(symbol)
+    if not company.get("filings_indexed_at"):
+        return await get_company_filings(symbol, company)
     return {"symbol": symbol, "company": company.get("name", symbol), "sector": company.get("sector", ""),
-            "isin": company.get("isin", ""), "bse_code": bse_code, "filings": unique[:15], "total": len(unique)}
+            "isin": company.get("isin", ""), "bse_code": company.get("bse_code", ""),
+            **await indexed_filings(symbol)}
 
 @app.post("/api/analyze")
 async def analyze(file: UploadFile = File(...), user=Depends(get_optional_user)):
@@ -2691,16 +4626,17 @@ async def analyze(file: UploadFile = File(...), user=Depends(get_optional_user))
     analysis_id = str(uuid.uuid4())
     user_id     = user["user_id"] if user else f"guest_{str(uuid.uuid4())[:8]}"
     await analyses_col.insert_one({"analysis_id": analysis_id, "user_id": user_id, "is_guest": user is None,
-        "filename": filename, "status": "processing", "created_at": datetime.utcnow().isoformat(), "result": None})
+        "filename": filename, "status": "processing", "created_at": datetime.utcnow().isoformat(), "result": None,
+        **analysis_expiry(user)})
     try:
         loop = asyncio.get_event_loop()
         text = await loop.run_in_executor(executor, extract_pdf_text, content) if filename.lower().endswith(".pdf") else f"Image: {filename}"
         result = await run_analysis(text)
-        await analyses_col.update_one({"analysis_id": analysis_id}, {"$set": {"status": "completed", "result": result}})
+        await complete_analysis(analysis_id, result)
         return {"analysis_id": analysis_id, "status": "completed", "result": result}
     except Exception as e:
         msg = str(e); logger.error(f"analyze failed {analysis_id}: {msg}")
-        await analyses_col.update_one({"analysis_id": analysis_id}, {"$set": {"status": "failed", "message": msg}})
+        await fail_analysis(analysis_id, msg)
         return {"analysis_id": analysis_id, "status": "failed", "message": msg}
 
 # ─── SCREENER.IN INTEGRATION ─────────────────────────────────────────────────
@@ -2713,73 +4649,356 @@ SCREENER_HEADERS = {
 }
 
 
-async def fetch_screener_data(symbol: str, consolidated: bool = True) -> dict:
-    """Fetch clean structured financials from Screener.in for a given NSE/BSE symbol."""
-    url_type = "consolidated" if consolidated else "standalone"
-    url = f"https://www.screener.in/company/{symbol.upper()}/{url_type}/"
-    logger.info(f"Screener.in fetch: {url}")
+_SCREENER_SECTIONS = {"quarters": "quarterly_results", "profit-loss": "annual_results",
+                      "balance-sheet": "balance_sheet", "cash-flow": "cash_flow_data"}
+_SCREENER_RATIOS = [
+    ("market_cap",     re.compile(r"Market Cap$")),
+    ("pe_ratio",       re.compile(r"Stock P/E$")),
+    ("book_value",     re.compile(r"Book Value$")),
+    ("dividend_yield", re.compile(r"Dividend Yield$")),
+    ("roce",           re.compile(r"\bROCE$")),
+    ("roe",            re.compile(r"\bROE$")),
+    ("face_value",     re.compile(r"Face Value$")),
+    ("eps",            re.compile(r"EPS\s*(?:\([^)]+\))?$")),
+]
+_SCREENER_PERIOD_RE = re.compile(r"^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|20\d\d|ttm|fy\d|yr)")
+_SCREENER_NUMBER_RE = re.compile(r"\d[\d,\.]*")
+
+
+_SCREENER_TAG_RE   = re.compile(r"<(/?)(s(?:ection|pan)|t(?:[rdh]|itle)|h1)(?=[\s>/])([^>]*)>")   # Screener emits lowercase tags
+_SCREENER_ATTR_RE  = re.compile(r"""\b(id|class)\s*=\s*["']?([^"'>]*)""", re.I)
+_HTML_TAG_RE       = re.compile(r"<[^>]+>")
+
+def _html_text(raw: str) -> str:
+    return html_lib.unescape(_HTML_TAG_RE.sub("", raw))
+
+
+class _ScreenerPageParser:
+    """One pass over a Screener.in company page, fed in chunks as it downloads.
+
+    Only the tags that matter (section/tr/td/th/span/h1/title) become events;
+    the C regex engine skips everything else, and just the tail of the current
+    chunk is carried over. Collects the company name (h1.company-name, else the
+    first h1, else <title>), the top ratios (a span whose text ends in a ratio
+    label, valued by the first number in the span right after it) and the rows
+    of the four financial sections as [{label, values, headers}]. All cell
+    text is HTML-unescaped, so a row label reads "Profit & Loss", not the
+    "Profit &amp; Loss" the pre-streaming parser returned.
+    """
+
+    def __init__(self):
+        self.tables = {target: [] for target in _SCREENER_SECTIONS.values()}
+        self.sections_found: set = set()
+        self.ratios: dict = {}
+        self._buf = ""
+        self._names = {"h1_class": None, "h1": None, "title": None}
+        self._capture = None            # buffer for the h1/title being read
+        self._capture_kind = None       # "h1", "h1_class" or "title"
+        self._spans: list = []          # one text buffer per open <span>
+        self._pending_ratio = None      # ratio key waiting for its value span
+        self._value_depth = None        # span depth of that value span
+        self._section = None            # target table while inside a wanted <section>
+        self._section_depth = 0
+        self._headers: list = []
+        self._row = None
+        self._row_has_th = False
+        self._cell = None
+
+    @property
+    def company_name(self) -> str:
+        for kind in ("h1_class", "h1", "title"):
+            name = _html_text(self._names[kind] or "").strip()
+            if kind == "title": name = name.split("|")[0].strip()
+            if len(name) > 2: return name
+        return ""
+
+    def feed(self, chunk: str):
+        buf, pos = self._buf + chunk, 0
+        for m in _SCREENER_TAG_RE.finditer(buf):
+            if m.start() > pos: self._data(buf[pos:m.start()])
+            if m.group(1): self._end(m.group(2))
+            else: self._start(m.group(2), m.group(3))
+            pos = m.end()
+        cut = buf.rfind("<", pos)   # a tag may be split across chunks
+        if cut == -1:
+            self._data(buf[pos:]); self._buf = ""
+        else:
+            self._data(buf[pos:cut]); self._buf = buf[cut:]
+
+    def close(self):
+        if self._buf: self._data(self._buf)
+        self._buf = ""
+        if self._section: self._end_row()
+
+    def _start(self, tag, attrs):
+        if self._pending_ratio and self._value_depth is None and tag != "span":
+            self._pending_ratio = None      # the value must be the very next tag
+        if tag == "span":
+            self._spans.append([])
+            if self._pending_ratio and self._value_depth is None:
+                self._value_depth = len(self._spans)
+        elif tag == "section":
+            if self._section:
+                self._section_depth += 1
+            else:
+                sid = dict((k.lower(), v) for k, v in _SCREENER_ATTR_RE.findall(attrs)).get("id")
+                if sid in _SCREENER_SECTIONS and sid not in self.sections_found:
+                    self.sections_found.add(sid)
+                    self._section, self._section_depth, self._headers = _SCREENER_SECTIONS[sid], 1, []
+        elif self._section and tag == "tr":
+            self._end_row()
+            self._row, self._row_has_th = [], False
+        elif self._section and tag in ("td", "th") and self._row is not None:
+            self._end_cell()
+            self._cell = []
+            if tag == "th": self._row_has_th = True
+        elif tag == "h1" and self._capture is None:
+            cls = dict((k.lower(), v) for k, v in _SCREENER_ATTR_RE.findall(attrs)).get("class") or ""
+            self._capture, self._capture_kind = [], "h1_class" if "company-name" in cls else "h1"
+        elif tag == "title" and self._names["title"] is None and self._capture is None:
+            self._capture, self._capture_kind = [], "title"
+
+    def _end(self, tag):
+        if tag == "span" and self._spans:
+            text = _html_text("".join(self._spans.pop()))
+            if self._value_depth is not None and len(self._spans) + 1 == self._value_depth:
+                m = _SCREENER_NUMBER_RE.search(text)
+                val = m.group(0).replace(",", "") if m else ""
+                if val and val != "0": self.ratios[self._pending_ratio] = val
+                self._pending_ratio = self._value_depth = None
+            elif self._pending_ratio is None:
+                label = text.strip()
+                for key, pat in _SCREENER_RATIOS:
+                    if key not in self.ratios and pat.search(label):
+                        self._pending_ratio = key
+                        break
+        elif tag == "section" and self._section:
+            self._section_depth -= 1
+            if not self._section_depth:
+                self._end_row()
+                self._section = None
+        elif self._section and tag in ("td", "th"):
+            self._end_cell()
+        elif self._section and tag == "tr":
+            self._end_row()
+        elif tag in ("h1", "title") and self._capture is not None:
+            text = "".join(self._capture)
+            for kind in {self._capture_kind, "h1" if tag == "h1" else "title"}:
+                if self._names[kind] is None: self._names[kind] = text
+            self._capture = self._capture_kind = None
+
+    def _data(self, data):
+        if not data: return
+        for buf in self._spans: buf.append(data)
+        if self._cell is not None: self._cell.append(data)
+        if self._capture is not None: self._capture.append(data)
+
+    def _end_cell(self):
+        if self._cell is None or self._row is None: return
+        text = _html_text("".join(self._cell)).replace("\xa0", " ")
+        self._row.append(re.sub(r"\s+", " ", text).strip())
+        self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        cells, self._row = self._row, None
+        if not cells or not any(cells): return
+        first = cells[0].lower()
+        if self._row_has_th or not first or _SCREENER_PERIOD_RE.match(first):
+            if any(cells[1:]) or not first:
+                self._headers = list(cells)
+            return
+        if any(cells[1:]):
+            self.tables[self._section].append({"label": cells[0], "values": cells[1:], "headers": list(self._headers)})
+
+
+# ─── SCREENER SERIES ─────────────────────────────────────────────────────────
+# Each Screener section is converted once into a month period index and a float
+# matrix (line items x periods, NaN for blanks). Growth, margins, CAGR and TTM
+# for every line item are then whole-matrix operations. The TTM column Screener
+# appends to annual tables keeps its slot with a NaT period, so column i of the
+# matrix is always column i of the original row strings.
+_SCREENER_MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+_SCREENER_REVENUE_LABELS = ("sales", "revenue", "revenue from operations", "total income")
+_NAT_MONTH = np.datetime64("NaT", "M")
+
+
+def _screener_period(header: str) -> np.datetime64:
+    parts = header.strip().lower().split()
+    if len(parts) == 2 and parts[0][:3] in _SCREENER_MONTHS and parts[1].isdigit():
+        return np.datetime64(f"{int(parts[1]):04d}-{_SCREENER_MONTHS[parts[0][:3]]:02d}", "M")
+    return _NAT_MONTH
+
+def _screener_number(cell: str) -> float:
+    s = cell.replace(",", "").replace("%", "").strip()
+    neg = s.startswith("(") and s.endswith(")")
     try:
-        async with httpx.AsyncClient(timeout=30, follow_redirects=True) as c:
-            r = await c.get(url, headers=SCREENER_HEADERS)
-            if r.status_code == 404 and consolidated:
-                url = f"https://www.screener.in/company/{symbol.upper()}/"
-                r = await c.get(url, headers=SCREENER_HEADERS)
-            if r.status_code != 200:
-                raise Exception(
-                    f"Screener.in returned HTTP {r.status_code} for '{symbol}'. "
-                    f"Verify the symbol is a valid NSE ticker (e.g. RELIANCE, TCS, HDFCBANK)."
-                )
-            html = r.text
-    except Exception as e:
-        raise Exception(f"Could not reach Screener.in: {e}")
+        v = float(s[1:-1] if neg else s)
+    except ValueError:
+        return np.nan
+    return -v if neg else v
+
+def _screener_unit(label: str, cells: list) -> str:
+    l = label.lower()
+    if "%" in l or any(c.endswith("%") for c in cells): return "%"
+    if "eps" in l or " in rs" in l: return "rs"
+    if "days" in l: return "days"
+    return "cr"
+
+
+class ScreenerTable:
+    __slots__ = ("labels", "units", "cells", "periods", "values", "ttm_col")
+
+    def __init__(self, rows: list):
+        headers = rows[0].get("headers", [])[1:] if rows else []
+        n = max([len(headers)] + [len(r["values"]) for r in rows])
+        self.labels = [r["label"].rstrip("+ ").strip() for r in rows]
+        self.cells  = [r["values"] + [""] * (n - len(r["values"])) for r in rows]
+        self.units  = np.array([_screener_unit(l, c) for l, c in zip(self.labels, self.cells)], dtype=object)
+        self.periods = np.array([_screener_period(h) for h in headers] + [_NAT_MONTH] * (n - len(headers)),
+                                dtype="datetime64[M]")
+        self.ttm_col = next((i for i, h in enumerate(headers) if h.strip().lower() == "ttm"), None)
+        self.values = np.array([[_screener_number(c) for c in row] for row in self.cells],
+                               dtype=np.float64).reshape(len(rows), n)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def latest(self) -> Optional[int]:
+        """Column of the most recent dated period (skips TTM)."""
+        dated = np.flatnonzero(~np.isnat(self.periods))
+        return int(dated[-1]) if len(dated) else None
+
+    def row(self, *names) -> Optional[int]:
+        for i, label in enumerate(self.labels):
+            if label.lower() in names: return i
+        return None
 
-    result = {
-        "symbol": symbol.upper(), "url": url, "consolidated": consolidated,
-        "company_name": "", "ratios": {},
-        "quarterly_results": [], "annual_results": [], "balance_sheet": [],
-        "cash_flow_data": [],
-        "raw_text": "",
-    }
+    def lag(self, months: int) -> np.ndarray:
+        """For each column, the column dated `months` earlier, or -1."""
+        valid = ~np.isnat(self.periods)
+        m  = self.periods.astype(np.int64)
+        eq = (m[None, :] == m[:, None] - months) & valid[None, :] & valid[:, None]
+        return np.where(eq.any(axis=1), eq.argmax(axis=1), -1)
+
+    def growth(self, months: int) -> np.ndarray:
+        """% change vs the period `months` earlier; NaN for % rows and missing/zero bases."""
+        idx  = self.lag(months)
+        prev = np.where(idx >= 0, self.values[:, idx], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g = (self.values - prev) / np.abs(prev) * 100
+        g[~np.isfinite(g) | (self.units == "%")[:, None]] = np.nan
+        return g
+
+    def margin(self) -> np.ndarray:
+        """Each crore line item as a % of revenue in the same period."""
+        rev = self.row(*_SCREENER_REVENUE_LABELS)
+        out = np.full(self.values.shape, np.nan)
+        if rev is None: return out
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = self.values / self.values[rev] * 100
+        out[~np.isfinite(out) | (self.units != "cr")[:, None]] = np.nan
+        return out
 
-    # Company name
-    for pat in [r'<h1[^>]*class="[^"]*company-name[^"]*"[^>]*>(.*?)</h1>',
-                r'<h1[^>]*>(.*?)</h1>',
-                r'<title>([^<|]+)']:
-        m = re.search(pat, html, re.S)
-        if m:
-            name = re.sub(r'<[^>]+>', '', m.group(1)).strip()
-            if name and len(name) > 2:
-                result["company_name"] = name
-                break
+    def rolling_sum(self, k: int = 4) -> np.ndarray:
+        """Trailing k-quarter sums; NaN unless the k quarters are consecutive and complete."""
+        n   = self.values.shape[1]
+        out = np.full(self.values.shape, np.nan)
+        if n < k: return out
+        sums = np.lib.stride_tricks.sliding_window_view(self.values, k, axis=1).sum(axis=-1)
+        m = self.periods.astype(np.int64)
+        consecutive = (~np.isnat(self.periods[k - 1:]) & ~np.isnat(self.periods[:n - k + 1]) &
+                       (m[k - 1:] - m[:n - k + 1] == 3 * (k - 1)))
+        out[:, k - 1:] = np.where(consecutive, sums, np.nan)
+        out[self.units == "%"] = np.nan
+        return out
 
-    # Key ratios
-    ratio_defs = [
-        ("market_cap",     [r'Market Cap\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("pe_ratio",       [r'Stock P/E\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("book_value",     [r'Book Value\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("dividend_yield", [r'Dividend Yield\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("roce",           [r'\bROCE\b\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("roe",            [r'\bROE\b\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("face_value",     [r'Face Value\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-        ("eps",            [r'EPS\s*(?:\([^)]+\))?\s*</span>[^<]*<span[^>]*>\s*([\d,\.]+)']),
-    ]
-    for key, patterns in ratio_defs:
-        for pat in patterns:
-            m = re.search(pat, html, re.S)
-            if m:
-                val = re.sub(r'<[^>]+>', '', m.group(1)).strip().replace(",", "")
-                if val and val != "0":
-                    result["ratios"][key] = val
-                    break
+    def cagr(self, years: int) -> np.ndarray:
+        """CAGR % per line item from `years` before the latest period to the latest."""
+        last = self.latest()
+        base = self.lag(12 * years)[last] if last is not None else -1
+        if base < 0: return np.full(len(self), np.nan)
+        cur, old = self.values[:, last], self.values[:, base]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = (np.power(cur / old, 1 / years) - 1) * 100
+        out[~((cur > 0) & (old > 0)) | (self.units == "%")] = np.nan
+        return out
 
-    # Parse financial table sections
-    for section_id, target in [("quarters", "quarterly_results"),
-                                ("profit-loss", "annual_results"),
-                                ("balance-sheet", "balance_sheet"),
-                                ("cash-flow", "cash_flow_data")]:
-        section_html = _extract_section(html, section_id)
-        if section_html:
-            result[target] = _parse_screener_table(section_html)
+
+def screener_series(data: dict) -> dict:
+    """Typed tables for every Screener section that has rows."""
+    return {target: ScreenerTable(data[target]) for target in _SCREENER_SECTIONS.values() if data.get(target)}
+
+def _json_floats(arr: np.ndarray) -> list:
+    return [None if v != v else round(v, 2) for v in np.asarray(arr, dtype=np.float64).tolist()]
+
+def screener_metrics(series: dict) -> dict:
+    """Per-section period index plus values and derived metrics for every line item."""
+    out = {}
+    for target, t in series.items():
+        derived = {"yoy_pct": t.growth(12)}
+        if target == "quarterly_results":
+            derived["qoq_pct"] = t.growth(3)
+            derived["ttm"] = t.rolling_sum(4)
+        if target in ("quarterly_results", "annual_results"):
+            derived["margin_pct"] = t.margin()
+        cagr = {f"cagr_{y}y_pct": t.cagr(y) for y in (3, 5)} if target != "quarterly_results" else {}
+        periods = [("TTM" if i == t.ttm_col else None) if np.isnat(p) else str(p)
+                   for i, p in enumerate(t.periods)]
+        rows = []
+        for i, label in enumerate(t.labels):
+            row = {"label": label, "unit": t.units[i], "values": _json_floats(t.values[i])}
+            for k, arr in derived.items():
+                row[k] = _json_floats(arr[i])
+            for k, arr in cagr.items():
+                v = float(arr[i])
+                row[k] = None if v != v else round(v, 2)
+            if target == "annual_results" and t.ttm_col is not None:
+                v = float(t.values[i, t.ttm_col])
+                row["ttm"] = None if v != v else v
+            rows.append(row)
+        out[target] = {"periods": periods, "latest": periods[t.latest()] if t.latest() is not None else None,
+                       "rows": rows}
+    return out
+
+
+async def _stream_screener_page(c: httpx.AsyncClient, url: str, conditional: dict = None):
+    """(status, parser or None, validators); the body is parsed as it arrives."""
+    async with c.stream("GET", url, headers={**SCREENER_HEADERS, **(conditional or {})}) as r:
+        if r.status_code != 200:
+            return r.status_code, None, {}
+        parser = _ScreenerPageParser()
+        async for chunk in r.aiter_text():
+            parser.feed(chunk)
+        parser.close()
+        return 200, parser, {"etag": r.headers.get("etag"), "last_modified": r.headers.get("last-modified")}
+
+
+# Parsed pages are cached per (symbol, consolidated). An entry is served as-is
+# for _SCREENER_FRESH_TTL, then revalidated with its ETag/Last-Modified; if
+# Screener is unreachable the last good copy is served. The URL variant that
+# worked (consolidated, or the plain page for standalone-only companies) is
+# remembered per symbol so the 404 fallback round trip happens once.
+_SCREENER_FRESH_TTL     = 900
+_SCREENER_CACHE_MAX     = 500
+_SCREENER_REFRESH_EVERY = 900
+_SCREENER_REFRESH_TOP   = 20
+_SCREENER_CONCURRENCY   = 4     # simultaneous page fetches; cache hits never wait on this
+_screener_sem = asyncio.Semaphore(_SCREENER_CONCURRENCY)
+_screener_cache: "OrderedDict[tuple, dict]" = OrderedDict()   # (SYMBOL, consolidated) -> entry
+_screener_variant: dict = {}    # (SYMBOL, consolidated) -> url that served it
+_screener_inflight: dict = {}   # (SYMBOL, consolidated) -> task
+
+def _screener_result(symbol: str, consolidated: bool, url: str, parser: "_ScreenerPageParser") -> tuple:
+    result = {
+        "symbol": symbol, "url": url, "consolidated": consolidated,
+        "company_name": parser.company_name, "ratios": parser.ratios,
+        **parser.tables,
+        "raw_text": "",
+    }
+    for section_id, target in _SCREENER_SECTIONS.items():
+        if section_id in parser.sections_found:
             logger.info(f"Screener section '{section_id}': {len(result[target])} rows parsed")
         else:
             logger.warning(f"Screener section '{section_id}' not found in HTML")
@@ -2790,156 +5009,148 @@ async def fetch_screener_data(symbol: str, consolidated: bool = True) -> dict:
             f"Check the symbol spelling (use NSE ticker, e.g. RELIANCE not Reliance Industries)."
         )
 
-    result["raw_text"] = _screener_to_text(result)
+    series = screener_series(result)
+    result["raw_text"] = _screener_to_text(result, series)
     logger.info(
         f"Screener.in {symbol}: qtr={len(result['quarterly_results'])}, "
         f"annual={len(result['annual_results'])}, cf={len(result['cash_flow_data'])}, ratios={list(result['ratios'].keys())}"
     )
-    return result
-
-
-def _extract_section(html: str, section_id: str) -> str:
-    """Robustly extract a <section id="..."> block from HTML."""
-    import re as _re
-    pattern = f'<section[^>]*\\bid="{_re.escape(section_id)}"[^>]*>'
-    m = _re.search(pattern, html, _re.S)
-    if not m:
-        return ""
-    start = m.end()
-    depth = 1
-    pos = start
-    while pos < len(html) and depth > 0:
-        next_open  = html.find("<section", pos)
-        next_close = html.find("</section>", pos)
-        if next_close == -1:
-            break
-        if next_open != -1 and next_open < next_close:
-            depth += 1
-            pos = next_open + 8
-        else:
-            depth -= 1
-            if depth == 0:
-                return html[start:next_close]
-            pos = next_close + 10
-    return html[start:pos]
-
-
-def _parse_screener_table(html_section: str) -> list:
-    """Parse a Screener.in HTML table into [{label, values, headers}] list."""
-    rows = []
-    headers = []
-
-    for tr in re.findall(r'<tr[^>]*>(.*?)</tr>', html_section, re.S):
-        has_th = bool(re.search(r'<th[\s>]', tr, re.S))
-        cells = re.findall(r'<t[dh][^>]*>(.*?)</t[dh]>', tr, re.S)
-
-        def clean(c):
-            c = re.sub(r'<[^>]+>', '', c)
-            c = c.replace('\xa0', ' ').replace('&nbsp;', ' ').replace('\n', ' ')
-            return re.sub(r'\s+', ' ', c).strip()
-
-        cells = [clean(c) for c in cells]
-        if not cells or not any(c for c in cells):
-            continue
-
-        first = cells[0].lower().strip()
+    return result, series
 
-        is_period = bool(re.match(
-            r'^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|20\d\d|ttm|fy\d|yr)',
-            first
-        ))
-        is_header = has_th or not first or is_period
-
-        if is_header:
-            period_cells = [c for c in cells[1:] if c]
-            if period_cells or not first:
-                headers = list(cells)
-            continue
+async def _load_screener_page(symbol: str, consolidated: bool) -> dict:
+    key    = (symbol, consolidated)
+    cached = _screener_cache.get(key)
+    url_type = "consolidated" if consolidated else "standalone"
+    url = _screener_variant.get(key) or f"https://www.screener.in/company/{symbol}/{url_type}/"
+    conditional = {}
+    if cached:
+        if cached.get("etag"): conditional["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"): conditional["If-Modified-Since"] = cached["last_modified"]
+    logger.info(f"Screener.in fetch: {url}")
+    try:
+        async with _screener_sem, httpx.AsyncClient(timeout=30, follow_redirects=True) as c:
+            status, parser, validators = await _stream_screener_page(c, url, conditional)
+            if status == 304 and cached:
+                cached["fetched_at"] = time.time()
+                return cached
+            if status == 404 and consolidated and url.endswith("/consolidated/"):
+                url = f"https://www.screener.in/company/{symbol}/"
+                status, parser, validators = await _stream_screener_page(c, url)
+            if status != 200:
+                raise Exception(
+                    f"Screener.in returned HTTP {status} for '{symbol}'. "
+                    f"Verify the symbol is a valid NSE ticker (e.g. RELIANCE, TCS, HDFCBANK)."
+                )
+    except Exception as e:
+        raise Exception(f"Could not reach Screener.in: {e}")
 
-        if cells[0] and any(v for v in cells[1:] if v):
-            rows.append({"label": cells[0], "values": cells[1:], "headers": list(headers)})
+    data, series = _screener_result(symbol, consolidated, url, parser)
+    task = asyncio.create_task(store_screener_facts(data, series))
+    _facts_tasks.add(task)
+    task.add_done_callback(_facts_tasks.discard)
+    entry = {"data": data, "series": series, "fetched_at": time.time(), **validators}
+    _screener_variant[key] = url
+    _screener_cache[key] = entry
+    _screener_cache.move_to_end(key)
+    while len(_screener_cache) > _SCREENER_CACHE_MAX: _screener_cache.popitem(last=False)
+    return entry
+
+def _refresh_screener(symbol: str, consolidated: bool) -> asyncio.Task:
+    key  = (symbol, consolidated)
+    task = _screener_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_load_screener_page(symbol, consolidated))
+        _screener_inflight[key] = task
+        task.add_done_callback(lambda _t: _screener_inflight.pop(key, None))
+    return task
+
+async def _screener_entry(symbol: str, consolidated: bool) -> dict:
+    symbol = symbol.upper()
+    key    = (symbol, consolidated)
+    entry  = _screener_cache.get(key)
+    if entry and time.time() - entry["fetched_at"] < _SCREENER_FRESH_TTL:
+        _screener_cache.move_to_end(key)
+        return entry
+    try:
+        entry = await asyncio.shield(_refresh_screener(symbol, consolidated))
+    except Exception as e:
+        if not entry: raise
+        logger.warning(f"Screener refresh failed for {symbol}, serving cached copy: {e}")
+    return entry
 
-    return rows
+async def fetch_screener_data(symbol: str, consolidated: bool = True) -> dict:
+    """Fetch clean structured financials from Screener.in for a given NSE/BSE symbol."""
+    return dict((await _screener_entry(symbol, consolidated))["data"])
 
+async def fetch_screener_series(symbol: str, consolidated: bool = True) -> tuple:
+    """(data, {section: ScreenerTable}) for a symbol; both are shared cache objects, do not mutate."""
+    entry = await _screener_entry(symbol, consolidated)
+    return entry["data"], entry["series"]
 
-def _screener_to_text(data: dict) -> str:
+async def _screener_refresh_loop():
+    """Keep the most-wanted consolidated pages warm so user calls stay memory reads."""
+    while True:
+        await asyncio.sleep(_SCREENER_REFRESH_EVERY)
+        symbols = list(dict.fromkeys(POPULAR_SYMBOLS + [s for s, _ in _symbol_demand.most_common(_SCREENER_REFRESH_TOP)]))
+        for sym in symbols:
+            entry = _screener_cache.get((sym, True))
+            if entry and time.time() - entry["fetched_at"] < _SCREENER_FRESH_TTL * 0.8: continue
+            try:
+                await _refresh_screener(sym, True)
+            except Exception as e:
+                logger.warning(f"Screener background refresh failed for {sym}: {e}")
+            await asyncio.sleep(1)
+
+
+def _screener_to_text(data: dict, series: dict = None) -> str:
     """Convert Screener.in data to clean text optimised for AI analysis."""
-    import re as _re
+    series = series if series is not None else screener_series(data)
 
-    def _pin_quarterly(rows: list) -> tuple:
-        if not rows:
-            return "", "", []
-        hdrs = rows[0].get("headers", [])
-        if len(hdrs) < 2:
-            return "", "", []
+    def _pct(v) -> str:
+        return "" if v != v else f"{v:+.1f}%"
 
-        period_hdrs = hdrs[1:]
-        latest_idx  = len(period_hdrs) - 1
-        latest_label = period_hdrs[latest_idx].lower()
-        month_m = _re.search(r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', latest_label)
-        cur_month = month_m.group(1) if month_m else ""
-        yoy_idx = None
-        if cur_month:
-            for i in range(latest_idx - 3, max(latest_idx - 6, -1), -1):
-                if i >= 0 and cur_month in period_hdrs[i].lower():
-                    yoy_idx = i
-                    break
-        if yoy_idx is None and latest_idx >= 4:
-            yoy_idx = latest_idx - 4
-
-        latest_period = period_hdrs[latest_idx] if latest_idx < len(period_hdrs) else "Latest Quarter"
-        yoy_period    = period_hdrs[yoy_idx] if yoy_idx is not None else "Prior Year Same Quarter"
-
-        pinned = []
-        pinned.append(f"  LATEST QUARTER: {latest_period}")
-        pinned.append(f"  YoY COMPARISON: {yoy_period}")
-        pinned.append("")
-        for row in rows:
-            vals = row["values"]
-            cur_val = vals[latest_idx] if latest_idx < len(vals) else ""
-            yoy_val = vals[yoy_idx] if yoy_idx is not None and yoy_idx < len(vals) else ""
-            if cur_val and cur_val not in ("-", ""):
-                line = f"  {row['label']}: {cur_val}"
-                if yoy_val and yoy_val not in ("-", ""):
-                    line += f"  [YoY same qtr: {yoy_val}]"
-                pinned.append(line)
-        return latest_period, yoy_period, pinned
-
-    def _pin_annual(rows: list) -> tuple:
-        if not rows:
+    def _pin(t: "ScreenerTable", cur: int, ref: Optional[int], ref_label: str, extra: dict) -> list:
+        lines = []
+        for i, label in enumerate(t.labels):
+            cur_val = t.cells[i][cur]
+            if not cur_val or cur_val == "-":
+                continue
+            line = f"  {label}: {cur_val}"
+            ref_val = t.cells[i][ref] if ref is not None else ""
+            if ref_val and ref_val != "-":
+                line += f"  [{ref_label}: {ref_val}]"
+            computed = ", ".join(f"{k} {_pct(arr[i])}" for k, arr in extra.items() if arr[i] == arr[i])
+            if computed:
+                line += f"  ({computed})"
+            lines.append(line)
+        return lines
+
+    def _pin_quarterly(t: "ScreenerTable") -> tuple:
+        cur = t.latest()
+        if cur is None:
             return "", "", []
-        hdrs = rows[0].get("headers", [])
-        period_hdrs = hdrs[1:] if hdrs else []
-        if period_hdrs and "ttm" in period_hdrs[-1].lower():
-            period_hdrs = period_hdrs[:-1]
-            latest_idx = len(period_hdrs) - 1
-            ttm_present = True
-        else:
-            latest_idx = len(period_hdrs) - 1
-            ttm_present = False
-        prior_idx = latest_idx - 1 if latest_idx >= 1 else None
-
-        latest_yr = period_hdrs[latest_idx] if latest_idx < len(period_hdrs) else "Latest Year"
-        prior_yr  = period_hdrs[prior_idx]  if prior_idx is not None and prior_idx < len(period_hdrs) else "Prior Year"
-
-        hdrs_full = rows[0].get("headers", [])[1:]
-        lat_idx_full  = len(hdrs_full) - 1 if not ttm_present else len(hdrs_full) - 2
-        pri_idx_full  = lat_idx_full - 1 if lat_idx_full >= 1 else None
-
-        pinned = []
-        pinned.append(f"  LATEST FULL YEAR: {latest_yr}")
-        pinned.append(f"  PRIOR YEAR: {prior_yr}")
-        pinned.append("")
-        for row in rows:
-            vals = row["values"]
-            cur_val = vals[lat_idx_full] if lat_idx_full < len(vals) else ""
-            pri_val = vals[pri_idx_full] if pri_idx_full is not None and pri_idx_full < len(vals) else ""
-            if cur_val and cur_val not in ("-", ""):
-                line = f"  {row['label']}: {cur_val}"
-                if pri_val and pri_val not in ("-", ""):
-                    line += f"  [Prior year: {pri_val}]"
-                pinned.append(line)
-        return latest_yr, prior_yr, pinned
+        ref = int(t.lag(12)[cur])
+        if ref < 0:
+            ref = cur - 4 if cur >= 4 else None
+        latest_period = str(t.periods[cur].item().strftime("%b %Y"))
+        yoy_period    = str(t.periods[ref].item().strftime("%b %Y")) if ref is not None else "Prior Year Same Quarter"
+        pinned = [f"  LATEST QUARTER: {latest_period}", f"  YoY COMPARISON: {yoy_period}", ""]
+        extra = {"YoY": t.growth(12)[:, cur], "QoQ": t.growth(3)[:, cur]}
+        return latest_period, yoy_period, pinned + _pin(t, cur, ref, "YoY same qtr", extra)
+
+    def _pin_annual(t: "ScreenerTable", cagr: bool = True) -> tuple:
+        cur = t.latest()
+        if cur is None:
+            return "Latest Year", "Prior Year", []
+        ref = int(t.lag(12)[cur])
+        if ref < 0:
+            ref = cur - 1 if cur >= 1 else None
+        latest_yr = str(t.periods[cur].item().strftime("%b %Y"))
+        prior_yr  = str(t.periods[ref].item().strftime("%b %Y")) if ref is not None else "Prior Year"
+        extra = {"YoY": t.growth(12)[:, cur]}
+        if cagr:
+            extra.update({"3Y CAGR": t.cagr(3), "5Y CAGR": t.cagr(5)})
+        return latest_yr, prior_yr, _pin(t, cur, ref, "Prior year", extra)
 
     L = []
     L.append(f"COMPANY: {data['company_name']}")
@@ -2960,7 +5171,7 @@ def _screener_to_text(data: dict) -> str:
         L.append("")
 
     if data["quarterly_results"]:
-        latest_qtr, yoy_qtr, pinned_qtr = _pin_quarterly(data["quarterly_results"])
+        latest_qtr, yoy_qtr, pinned_qtr = _pin_quarterly(series["quarterly_results"])
         L.append(f"╔══════════════════════════════════════════════════╗")
         L.append(f"║  LATEST QUARTERLY RESULTS — {latest_qtr:<20} ║")
         L.append(f"╚══════════════════════════════════════════════════╝")
@@ -2980,7 +5191,8 @@ def _screener_to_text(data: dict) -> str:
         L.append("")
 
     if data["annual_results"]:
-        latest_yr, prior_yr, pinned_ann = _pin_annual(data["annual_results"])
+        latest_yr, prior_yr, pinned_ann = _pin_annual(series["annual_results"])
+        pinned_ann = [f"  LATEST FULL YEAR: {latest_yr}", f"  PRIOR YEAR: {prior_yr}", ""] + pinned_ann
         L.append(f"╔══════════════════════════════════════════════════╗")
         L.append(f"║  LATEST ANNUAL RESULTS — {latest_yr:<24} ║")
         L.append(f"╚══════════════════════════════════════════════════╝")
@@ -3010,15 +5222,8 @@ def _screener_to_text(data: dict) -> str:
 
     if data.get("cash_flow_data"):
         cf_rows = data["cash_flow_data"]
-        hdrs = cf_rows[0].get("headers", []) if cf_rows else []
-        # Pin latest year values
-        period_hdrs = hdrs[1:] if hdrs else []
-        if period_hdrs and "ttm" in period_hdrs[-1].lower():
-            period_hdrs = period_hdrs[:-1]
-        latest_idx = len(period_hdrs) - 1
-        prior_idx  = latest_idx - 1 if latest_idx >= 1 else None
-        latest_yr  = period_hdrs[latest_idx] if latest_idx >= 0 else "Latest Year"
-        prior_yr   = period_hdrs[prior_idx]  if prior_idx is not None else "Prior Year"
+        hdrs = cf_rows[0].get("headers", [])
+        latest_yr, prior_yr, pinned_cf = _pin_annual(series["cash_flow_data"], cagr=False)
 
         L.append(f"╔══════════════════════════════════════════════════╗")
         L.append(f"║  CASH FLOW STATEMENT — {latest_yr:<26} ║")
@@ -3029,15 +5234,7 @@ def _screener_to_text(data: dict) -> str:
         L.append(f"  [Compute OCF/PAT ratio for earnings quality assessment.]")
         L.append("")
 
-        for row in cf_rows:
-            vals = row["values"]
-            cur_val  = vals[latest_idx] if latest_idx < len(vals) else ""
-            pri_val  = vals[prior_idx]  if prior_idx is not None and prior_idx < len(vals) else ""
-            if cur_val and cur_val not in ("-", ""):
-                line = f"  {row['label']}: {cur_val}"
-                if pri_val and pri_val not in ("-", ""):
-                    line += f"  [Prior year: {pri_val}]"
-                L.append(line)
+        L.extend(pinned_cf)
         L.append("")
 
         L.append("--- FULL CASH FLOW TREND ---")
@@ -3068,14 +5265,17 @@ class ScreenerAnalyzeRequest(BaseModel):
 @app.post("/api/analyze-from-screener")
 async def analyze_from_screener(req: ScreenerAnalyzeRequest, user=Depends(get_optional_user)):
     """Fetch live data from Screener.in and run full AI analysis."""
+    note_symbol_demand(req.symbol, 2)
     analysis_id = str(uuid.uuid4())
     user_id = user["user_id"] if user else f"guest_{str(uuid.uuid4())[:8]}"
 
     await analyses_col.insert_one({
         "analysis_id": analysis_id, "user_id": user_id, "is_guest": user is None,
         "filename": f"{req.symbol.upper()}_screener",
-        "source": "screener", "status": "processing",
+        "source": "screener", "symbol": req.symbol.upper(), "consolidated": req.consolidated,
+        "status": "processing",
         "created_at": datetime.utcnow().isoformat(), "result": None,
+        **analysis_expiry(user),
     })
 
     try:
@@ -3095,10 +5295,7 @@ async def analyze_from_screener(req: ScreenerAnalyzeRequest, user=Depends(get_op
             "url": data["url"],
             "ratios": data["ratios"],
         }
-        await analyses_col.update_one(
-            {"analysis_id": analysis_id},
-            {"$set": {"status": "completed", "result": result, "screener_meta": meta}},
-        )
+        await complete_analysis(analysis_id, result, meta)
         logger.info(f"Screener complete: {req.symbol} → {analysis_id}")
         return {
             "analysis_id": analysis_id, "status": "completed",
@@ -3108,10 +5305,7 @@ async def analyze_from_screener(req: ScreenerAnalyzeRequest, user=Depends(get_op
     except Exception as e:
         msg = str(e)
         logger.error(f"Screener failed {analysis_id} ({req.symbol}): {msg}")
-        await analyses_col.update_one(
-            {"analysis_id": analysis_id},
-            {"$set": {"status": "failed", "message": msg}},
-        )
+        await fail_analysis(analysis_id, msg)
         return {"analysis_id": analysis_id, "status": "failed", "message": msg}
 
 
@@ -3126,58 +5320,755 @@ async def get_screener_preview(symbol: str, consolidated: bool = True):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.get("/api/screener/{symbol}/metrics")
+async def get_screener_metrics(symbol: str, consolidated: bool = True):
+    """Numeric Screener series with YoY/QoQ growth, margins, CAGR and TTM for every line item."""
+    try:
+        data, series = await fetch_screener_series(symbol, consolidated)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "symbol": data["symbol"], "consolidated": data["consolidated"],
+        "company_name": data["company_name"], "url": data["url"], "ratios": data["ratios"],
+        "sections": screener_metrics(series),
+    }
+
+
+# ─── PEER COMPARISON ─────────────────────────────────────────────────────────
+# Each company's Screener tables are laid onto one month grid per section
+# (union of every company's periods). Metrics are then read from the column
+# most companies have reported, so a peer that has not filed the latest
+# quarter shows a gap instead of shifting everyone onto different periods.
+_COMPARE_MAX_SYMBOLS = 20
+_COMPARE_ROWS = {
+    "revenue":    _SCREENER_REVENUE_LABELS,
+    "op_profit":  ("operating profit", "financing profit"),
+    "net_profit": ("net profit",),
+    "pbt":        ("profit before tax",),
+    "interest":   ("interest",),
+    "borrowings": ("borrowings", "borrowing"),
+    "equity":     ("equity capital",),
+    "reserves":   ("reserves",),
+}
+_COMPARE_METRICS = [
+    ("revenue_yoy_pct",      "growth"),   ("net_profit_yoy_pct",  "growth"),
+    ("revenue_cagr_3y_pct",  "growth"),   ("net_profit_cagr_3y_pct", "growth"),
+    ("revenue_ttm_cr",       "scale"),    ("market_cap",          "scale"),
+    ("opm_pct",              "margins"),  ("npm_pct",             "margins"),
+    ("annual_opm_pct",       "margins"),
+    ("pe_ratio",             "valuation"), ("pb_ratio",           "valuation"),
+    ("ev_ebitda",            "valuation"), ("dividend_yield_pct", "valuation"),
+    ("roe_pct",              "returns"),  ("roce_pct",            "returns"),
+    ("debt_to_equity",       "leverage"), ("interest_coverage",   "leverage"),
+]
+
+
+def _align_section(tables: list, keys: tuple) -> tuple:
+    """(month grid, {key: companies x grid matrix}) for the rows named by `keys`; missing tables stay NaN."""
+    dated = [t.periods[~np.isnat(t.periods)] for t in tables if t is not None]
+    grid  = np.unique(np.concatenate(dated)) if dated else np.empty(0, dtype="datetime64[M]")
+    mats  = {k: np.full((len(tables), len(grid)), np.nan) for k in keys}
+    for i, t in enumerate(tables):
+        if t is None: continue
+        valid = ~np.isnat(t.periods)
+        cols  = np.searchsorted(grid, t.periods[valid])
+        for k in keys:
+            r = t.row(*_COMPARE_ROWS[k])
+            if r is not None: mats[k][i, cols] = t.values[r, valid]
+    return grid, mats
+
+def _grid_col(grid: np.ndarray, mat: np.ndarray) -> Optional[int]:
+    """Latest grid column with the widest coverage across companies."""
+    cov = (~np.isnan(mat)).sum(axis=0)
+    if not cov.size or not cov.max(): return None
+    return int(np.flatnonzero(cov == cov.max())[-1])
+
+def _grid_back(grid: np.ndarray, col: Optional[int], months: int) -> Optional[int]:
+    if col is None: return None
+    j = int(np.searchsorted(grid, grid[col] - np.timedelta64(months, "M")))
+    return j if j < len(grid) and grid[j] == grid[col] - np.timedelta64(months, "M") else None
+
+def _take(mat: np.ndarray, col: Optional[int]) -> np.ndarray:
+    return mat[:, col] if col is not None else np.full(mat.shape[0], np.nan)
+
+def _ratio_float(val) -> float:
+    try: return float(str(val).replace(",", ""))
+    except (TypeError, ValueError): return np.nan
+
+
+def compute_peer_matrix(series: list, datas: list, quotes: list) -> dict:
+    """Side-by-side metrics for aligned companies; every metric is one vector op over all peers."""
+    n = len(series)
+    qg, q = _align_section([s.get("quarterly_results") for s in series], ("revenue", "op_profit", "net_profit"))
+    ag, a = _align_section([s.get("annual_results") for s in series], ("revenue", "op_profit", "net_profit", "pbt", "interest"))
+    bg, b = _align_section([s.get("balance_sheet") for s in series], ("borrowings", "equity", "reserves"))
+
+    qc, ac, bc = _grid_col(qg, q["revenue"]), _grid_col(ag, a["revenue"]), _grid_col(bg, b["equity"])
+    q_yoy, a_3y = _grid_back(qg, qc, 12), _grid_back(ag, ac, 36)
+    ttm_cols = [c for c in (_grid_back(qg, qc, m) for m in (9, 6, 3, 0)) if c is not None]
+
+    def _quote(field):
+        return np.array([_ratio_float(qt.get(field)) if qt else np.nan for qt in quotes])
+
+    def _screener_ratio(field):
+        return np.array([_ratio_float(d["ratios"].get(field)) for d in datas])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        def _growth(mat, cur, prev):
+            c, p = _take(mat, cur), _take(mat, prev)
+            return (c - p) / np.abs(p) * 100
+
+        def _cagr(mat, cur, prev, years):
+            c, p = _take(mat, cur), _take(mat, prev)
+            return np.where((c > 0) & (p > 0), (np.power(c / p, 1 / years) - 1) * 100, np.nan)
+
+        q_rev = _take(q["revenue"], qc)
+        a_rev = _take(a["revenue"], ac)
+        interest = _take(a["interest"], ac)
+        net_worth = _take(b["equity"], bc) + np.nan_to_num(_take(b["reserves"], bc))
+        pe = _quote("pe_ratio")
+        cols = {
+            "revenue_yoy_pct":        _growth(q["revenue"], qc, q_yoy),
+            "net_profit_yoy_pct":     _growth(q["net_profit"], qc, q_yoy),
+            "revenue_cagr_3y_pct":    _cagr(a["revenue"], ac, a_3y, 3),
+            "net_profit_cagr_3y_pct": _cagr(a["net_profit"], ac, a_3y, 3),
+            "revenue_ttm_cr":         q["revenue"][:, ttm_cols].sum(axis=1) if len(ttm_cols) == 4 else np.full(n, np.nan),
+            "market_cap":             _quote("market_cap"),
+            "opm_pct":                _take(q["op_profit"], qc) / q_rev * 100,
+            "npm_pct":                _take(q["net_profit"], qc) / q_rev * 100,
+            "annual_opm_pct":         _take(a["op_profit"], ac) / a_rev * 100,
+            "pe_ratio":               np.where(np.isnan(pe), _screener_ratio("pe_ratio"), pe),
+            "pb_ratio":               _quote("pb_ratio"),
+            "ev_ebitda":              _quote("ev_ebitda"),
+            "dividend_yield_pct":     np.where(np.isnan(_quote("dividend_yield_pct")),
+                                               _screener_ratio("dividend_yield"), _quote("dividend_yield_pct")),
+            "roe_pct":                _screener_ratio("roe"),
+            "roce_pct":               _screener_ratio("roce"),
+            "debt_to_equity":         np.nan_to_num(_take(b["borrowings"], bc)) / net_worth,
+            "interest_coverage":      np.where(interest > 0, (_take(a["pbt"], ac) + interest) / interest, np.nan),
+        }
+
+    def _label(grid, col):
+        return str(grid[col]) if col is not None else None
+
+    return {
+        "as_of":   {"quarter": _label(qg, qc), "year": _label(ag, ac), "balance_sheet": _label(bg, bc)},
+        "metrics": [{"key": k, "group": g, "values": [None if v != v or v in (float("inf"), float("-inf")) else round(v, 2)
+                                                      for v in cols[k].tolist()]}
+                    for k, g in _COMPARE_METRICS],
+    }
+
+
+@app.get("/api/compare")
+async def compare_companies(symbols: str, consolidated: bool = True):
+    """Peer comparison matrix for up to 20 symbols (comma-separated NSE tickers)."""
+    syms = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not syms:
+        raise HTTPException(400, "Provide symbols=SYM1,SYM2,...")
+    if len(syms) > _COMPARE_MAX_SYMBOLS:
+        raise HTTPException(400, f"Maximum {_COMPARE_MAX_SYMBOLS} symbols per comparison")
+
+    async def _no_quote(_sym):
+        return None
+
+    get_quote_fn = get_fmp_quote if FMP_API_KEY else _no_quote
+    screener, quotes = await asyncio.gather(
+        asyncio.gather(*[fetch_screener_series(s, consolidated) for s in syms], return_exceptions=True),
+        asyncio.gather(*[get_quote_fn(s) for s in syms], return_exceptions=True),
+    )
+
+    ok, errors = [], {}
+    for sym, sc, qt in zip(syms, screener, quotes):
+        if isinstance(sc, Exception):
+            errors[sym] = str(sc)
+            continue
+        if isinstance(qt, Exception):
+            logger.warning(f"Compare: no FMP quote for {sym}: {qt}")
+            qt = None
+        ok.append((sym, sc[0], sc[1], qt))
+    if not ok:
+        raise HTTPException(400, f"No Screener data for any symbol: {'; '.join(f'{k}: {v}' for k, v in errors.items())}")
+    for sym, _, _, _ in ok: note_symbol_demand(sym, 0.25)
+
+    matrix = compute_peer_matrix([s for _, _, s, _ in ok], [d for _, d, _, _ in ok], [q for _, _, _, q in ok])
+    companies = []
+    for sym, d, s, q in ok:
+        t = s.get("quarterly_results")
+        latest = t.latest() if t is not None else None
+        companies.append({"symbol": sym, "company_name": d["company_name"], "sector": (q or {}).get("sector"),
+                          "latest_quarter": str(t.periods[latest]) if latest is not None else None})
+    return {"symbols": [sym for sym, _, _, _ in ok], "consolidated": consolidated,
+            "companies": companies, **matrix, "errors": errors,
+            "fetched_at": datetime.utcnow().isoformat() + "Z"}
+
+
+# ─── FINANCIAL FACTS ─────────────────────────────────────────────────────────
+# The numbers behind every analysis, one doc per (symbol, period, consolidated)
+# (quarter and fiscal year kept apart)
+# in financial_facts with flat numeric fields (INR amounts in crores, ratios and
+# % as plain numbers), so screens are indexed range queries. Filing extractions
+# are authoritative; Screener series fill the periods no analysed filing covers.
+# Each (symbol, period_type, consolidated) has one doc flagged is_latest, kept
+# current on every write, so the default "latest" screen is a plain indexed find.
+FACT_FIELDS = (
+    "revenue", "revenue_prior", "revenue_yoy_pct", "revenue_qoq_pct", "other_income", "ebitda", "pbt",
+    "pat", "pat_prior", "pat_yoy_pct", "eps", "opm_pct", "npm_pct", "finance_costs", "depreciation",
+    "net_worth", "borrowings", "debt_equity", "interest_coverage", "current_ratio",
+    "debt_service_coverage", "total_debt_assets",
+)
+_FACT_INDEXED     = ("revenue_yoy_pct", "pat_yoy_pct", "opm_pct", "debt_equity")
+_FACT_UNIT_SCALE  = {"INR Crores": 1.0, "INR Lakhs": 0.01}
+_FACT_PERIOD_RE   = re.compile(r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*['\.\s\-]*(\d{4}|\d{2})\b", re.I)
+_facts_tasks: set = set()   # in-flight Screener fact writes, held until done
+
+
+def _fact_period(text: str) -> Optional[str]:
+    """'31st Dec 2024' / "30th Sep'24" -> '2024-12' / '2024-09'."""
+    m = _FACT_PERIOD_RE.search(text or "")
+    if not m: return None
+    year = int(m.group(2))
+    return f"{year + 2000 if year < 100 else year:04d}-{_SCREENER_MONTHS[m.group(1).lower()[:3]]:02d}"
+
+def _fact_id(symbol: str, period: str, period_type: str, consolidated: bool) -> str:
+    # The March quarter and the March fiscal year share a month, so the type is part of the key.
+    return f"{symbol}:{period_type[0]}{period}:{'c' if consolidated else 's'}"
+
+def _fact_num(val) -> Optional[float]:
+    v = _ratio_float(val)
+    return None if v != v else v
+
+def _pct_change(cur: Optional[float], prior: Optional[float]) -> Optional[float]:
+    if cur is None or not prior: return None
+    return round((cur - prior) / abs(prior) * 100, 2)
+
+
+def facts_from_extraction(det: dict) -> dict:
+    """Flat numeric facts from _extract_deterministic output."""
+    scale = _FACT_UNIT_SCALE.get(det.get("currency"), 1.0)
+    pl, ratios, bs = det.get("pl", {}), det.get("ratios", {}), det.get("balance_sheet", {})
+
+    def amt(store, key, which="current"):
+        v = _fact_num(store.get(key, {}).get(which))
+        return None if v is None else round(v * scale, 2)
+
+    pat_key = "pat_owners" if "pat_owners" in pl else "pat_total"
+    f = {
+        "revenue": amt(pl, "revenue"), "revenue_prior": amt(pl, "revenue", "prior"),
+        "other_income": amt(pl, "other_income"), "pbt": amt(pl, "pbt"),
+        "pat": amt(pl, pat_key), "pat_prior": amt(pl, pat_key, "prior"),
+        "finance_costs": amt(pl, "finance_costs"), "depreciation": amt(pl, "depreciation"),
+        "eps": _fact_num(pl.get("eps_basic", {}).get("current")),
+        "net_worth": amt(bs, "net_worth"),
+    }
+    for k in ("debt_equity", "interest_coverage", "current_ratio", "debt_service_coverage", "total_debt_assets"):
+        f[k] = _fact_num(ratios.get(k, {}).get("current"))
+    f["revenue_yoy_pct"] = _pct_change(f["revenue"], f["revenue_prior"])
+    f["pat_yoy_pct"]     = _pct_change(f["pat"], f["pat_prior"])
+    if None not in (f["pbt"], f["finance_costs"], f["depreciation"]):
+        f["ebitda"] = round(f["pbt"] + f["finance_costs"] + f["depreciation"] - (f["other_income"] or 0), 2)
+    if f["revenue"]:
+        if f.get("ebitda") is not None: f["opm_pct"] = round(f["ebitda"] / f["revenue"] * 100, 2)
+        if f["pat"] is not None:        f["npm_pct"] = round(f["pat"] / f["revenue"] * 100, 2)
+    return {k: v for k, v in f.items() if v is not None}
+
+
+def facts_from_screener(series: dict) -> List[tuple]:
+    """[(period, period_type, facts)] for every dated quarterly and annual column. Quarters
+    carry leverage from the latest balance sheet on or before them."""
+    bs = series.get("balance_sheet")
+    bs_periods, bs_cols = np.empty(0, dtype="datetime64[M]"), {}
+    if bs is not None:
+        def _line(key):
+            r = bs.row(*_COMPARE_ROWS[key])
+            return bs.values[r] if r is not None else np.full(len(bs.periods), np.nan)
+
+        dated  = ~np.isnat(bs.periods)
+        borrow = _line("borrowings")
+        net_worth = _line("equity") + np.nan_to_num(_line("reserves"))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            de = np.where(net_worth > 0, np.nan_to_num(borrow) / net_worth, np.nan)
+        bs_periods = bs.periods[dated]
+        bs_cols = {"borrowings": borrow[dated], "net_worth": net_worth[dated], "debt_equity": de[dated]}
+
+    out = []
+    for target, ptype in (("quarterly_results", "quarter"), ("annual_results", "year")):
+        t = series.get(target)
+        if t is None: continue
+        rows = {k: t.row(*_COMPARE_ROWS[k]) for k in ("revenue", "op_profit", "net_profit", "pbt", "interest")}
+        rows["eps"] = t.row("eps in rs", "eps")
+        growth, margin = t.growth(12), t.margin()
+        qoq = t.growth(3) if ptype == "quarter" else None
+        cols = {}
+        for field, key, mat in (("revenue", "revenue", t.values), ("pat", "net_profit", t.values),
+                                ("ebitda", "op_profit", t.values), ("pbt", "pbt", t.values),
+                                ("finance_costs", "interest", t.values), ("eps", "eps", t.values),
+                                ("revenue_yoy_pct", "revenue", growth), ("pat_yoy_pct", "net_profit", growth),
+                                ("opm_pct", "op_profit", margin), ("npm_pct", "net_profit", margin),
+                                ("revenue_qoq_pct", "revenue", qoq)):
+            if mat is not None and rows[key] is not None: cols[field] = mat[rows[key]]
+        dated = np.flatnonzero(~np.isnat(t.periods))
+        bs_idx = np.searchsorted(bs_periods, t.periods[dated], side="right") - 1
+        for col, b in zip(dated.tolist(), bs_idx.tolist()):
+            facts = {f: float(v[col]) for f, v in cols.items()}
+            if b >= 0: facts.update({f: float(v[b]) for f, v in bs_cols.items()})
+            facts = {f: round(v, 2) for f, v in facts.items() if v == v and v not in (float("inf"), float("-inf"))}
+            if facts: out.append((str(t.periods[col]), ptype, facts))
+    return out
+
+
+async def mark_latest_facts(symbol: str, consolidated: bool, period_types=("quarter", "year")):
+    """Flag the newest period of each type for `symbol` as is_latest and clear the rest."""
+    from pymongo import UpdateOne, UpdateMany
+    for ptype in period_types:
+        scope = {"symbol": symbol, "consolidated": consolidated, "period_type": ptype}
+        top = await financial_facts_col.find_one(scope, {"_id": 1}, sort=[("period", -1)])
+        if not top: continue
+        await financial_facts_col.bulk_write([
+            UpdateOne({"_id": top["_id"]}, {"$set": {"is_latest": True}}),
+            UpdateMany({**scope, "_id": {"$ne": top["_id"]}, "is_latest": {"$ne": False}},
+                       {"$set": {"is_latest": False}}),
+        ], ordered=True)
+
+async def backfill_latest_facts():
+    """Set is_latest for facts written before the flag existed."""
+    try:
+        async for g in financial_facts_col.aggregate([
+                {"$match": {"is_latest": {"$exists": False}}},
+                {"$group": {"_id": {"symbol": "$symbol", "consolidated": "$consolidated"}}}]):
+            await mark_latest_facts(g["_id"]["symbol"], g["_id"]["consolidated"])
+    except Exception as e:
+        logger.warning(f"Backfilling latest facts failed: {e}")
+
+async def store_filing_facts(symbol: str, det: dict, analysis_id: str = None, pdf_url: str = None) -> Optional[str]:
+    period = _fact_period(det.get("period"))
+    facts  = facts_from_extraction(det)
+    if not period or not facts: return None
+    consolidated = bool(det.get("consolidated"))
+    # is_quarterly goes False on any "year ended" column, which most quarterly
+    # results carry; the heading the period came from is what tells them apart.
+    # Only a March period can be a fiscal year.
+    period_type  = "year" if det.get("period_heading") == "year" and period.endswith("-03") else "quarter"
+    fact_id = _fact_id(symbol, period, period_type, consolidated)
+    # Filings are authoritative: replace, so no Screener-only field survives under source="filing".
+    await financial_facts_col.replace_one({"_id": fact_id}, {
+        "symbol": symbol, "period": period, "period_type": period_type,
+        "consolidated": consolidated, "source": "filing", "company_name": det.get("company_name") or symbol,
+        "currency": det.get("currency"), "analysis_id": analysis_id, "pdf_url": pdf_url,
+        "updated_at": datetime.utcnow(), **facts}, upsert=True)
+    await mark_latest_facts(symbol, consolidated, (period_type,))
+    return fact_id
+
+async def record_filing_facts(det: dict, symbol: Optional[str], source: str, pdf_url: str, analysis_id: str):
+    """Best effort: facts never fail an analysis. The symbol falls back to the filing index."""
+    try:
+        if not det: return
+        if not symbol:
+            rec = await filings_col.find_one({"_id": _filing_id(source, pdf_url)}, {"symbol": 1})
+            symbol = rec.get("symbol") if rec else None
+        if not symbol: return
+        fact_id = await store_filing_facts(symbol.upper(), det, analysis_id, pdf_url)
+        if fact_id: logger.info(f"Stored facts {fact_id}")
+    except Exception as e:
+        logger.warning(f"Storing facts for {pdf_url} failed: {e}")
+
+async def store_screener_facts(data: dict, series: dict):
+    from pymongo import UpdateOne
+    symbol, consolidated = data["symbol"], data["consolidated"]
+    try:
+        filed = {d["_id"] async for d in financial_facts_col.find(
+            {"symbol": symbol, "consolidated": consolidated, "source": "filing"}, {"_id": 1})}
+        now = datetime.utcnow()
+        ops = [UpdateOne({"_id": _fact_id(symbol, period, ptype, consolidated)}, {"$set": {
+                   "symbol": symbol, "period": period, "period_type": ptype, "consolidated": consolidated,
+                   "source": "screener", "company_name": data["company_name"] or symbol, "currency": "INR Crores",
+                   "updated_at": now, **facts}}, upsert=True)
+               for period, ptype, facts in facts_from_screener(series)
+               if _fact_id(symbol, period, ptype, consolidated) not in filed]
+        if ops:
+            await financial_facts_col.bulk_write(ops, ordered=False)
+            await mark_latest_facts(symbol, consolidated)
+    except Exception as e:
+        logger.warning(f"Storing Screener facts for {symbol} failed: {e}")
+
+
+_SCREEN_COND_RE = re.compile(r"^\s*(\w+)\s*(>=|<=|>|<|=)\s*(-?\d+(?:\.\d+)?)\s*$")
+_SCREEN_OPS     = {">": "$gt", ">=": "$gte", "<": "$lt", "<=": "$lte", "=": "$eq"}
+_SCREEN_MAX     = 200
+
+
+@app.get("/api/screen")
+async def screen_companies(where: str, period: str = "latest", period_type: str = "quarter",
+                           consolidated: bool = True, sort: Optional[str] = None, limit: int = 50):
+    """Screen analysed companies on stored facts, e.g. where=revenue_yoy_pct>20,debt_equity<0.5"""
+    conds, first = {}, None
+    for part in where.split(","):
+        if not part.strip(): continue
+        m = _SCREEN_COND_RE.match(part)
+        if not m:
+            raise HTTPException(400, f"Bad condition '{part.strip()}'. Use field>value, e.g. revenue_yoy_pct>20")
+        field, op, val = m.groups()
+        if field not in FACT_FIELDS:
+            raise HTTPException(400, f"Unknown field '{field}'. Valid: {', '.join(FACT_FIELDS)}")
+        conds.setdefault(field, {})[_SCREEN_OPS[op]] = float(val)
+        first = first or (field, op)
+    if not conds:
+        raise HTTPException(400, "Provide at least one condition in where=")
+    if period_type not in ("quarter", "year"):
+        raise HTTPException(400, "period_type must be 'quarter' or 'year'")
+    sort_field = (sort or "").lstrip("-") or first[0]
+    if sort_field not in FACT_FIELDS:
+        raise HTTPException(400, f"Unknown sort field '{sort_field}'")
+    direction = (-1 if sort.startswith("-") else 1) if sort else (1 if first[1].startswith("<") else -1)
+
+    if period != "latest" and not re.fullmatch(r"\d{4}-\d{2}", period):
+        raise HTTPException(400, "period must be 'latest' or YYYY-MM")
+
+    projection = {"_id": 0, "symbol": 1, "company_name": 1, "period": 1, "source": 1, "analysis_id": 1,
+                  **{f: 1 for f in ("revenue", "pat", "revenue_yoy_pct", "pat_yoy_pct", "opm_pct", "debt_equity")},
+                  **{f: 1 for f in conds}, sort_field: 1}
+    # "latest" screens each company on its own most recent period (reported in
+    # the row), so early filers don't push everyone else out of the screen.
+    query = {"period_type": period_type, "consolidated": consolidated,
+             **({"is_latest": True} if period == "latest" else {"period": period}), **conds}
+    limit = max(1, min(limit, _SCREEN_MAX))
+    results = await financial_facts_col.find(query, projection).sort(sort_field, direction).limit(limit).to_list(limit)
+    return {"period": period, "period_type": period_type, "consolidated": consolidated,
+            "where": where, "count": len(results), "results": results}
+
+
 @app.post("/api/analyze-from-url")
 async def analyze_from_url(req: AnalyzeFromURLRequest, user=Depends(get_optional_user)):
     analysis_id = str(uuid.uuid4())
     user_id     = user["user_id"] if user else f"guest_{str(uuid.uuid4())[:8]}"
     await analyses_col.insert_one({"analysis_id": analysis_id, "user_id": user_id, "is_guest": user is None,
         "filename": req.filename, "source": req.source, "pdf_url": req.pdf_url,
-        "status": "processing", "created_at": datetime.utcnow().isoformat(), "result": None})
+        "status": "processing", "created_at": datetime.utcnow().isoformat(), "result": None,
+        **analysis_expiry(user)})
     try:
+        running = _preanalysis_running.get(req.pdf_url)
+        if running: await asyncio.shield(running)
+        done   = await find_completed_analysis(req.pdf_url)
+        result = await adopt_analysis(analysis_id, done) if done else None
+        if result is not None:
+            logger.info(f"Reused stored analysis for {req.pdf_url}")
+            return {"analysis_id": analysis_id, "status": "completed", "result": result}
         logger.info(f"Fetching PDF from {req.source}: {req.pdf_url}")
-        headers = NSE_HEADERS if req.source == "nse" else BSE_HEADERS
-        async with httpx.AsyncClient(timeout=45, follow_redirects=True) as c:
-            if req.source == "nse": await c.get("https://www.nseindia.com/", headers=NSE_HEADERS)
-            elif req.source == "bse": await c.get("https://www.bseindia.com/", headers=BSE_HEADERS)
-            r = await c.get(req.pdf_url, headers=headers)
-        if r.status_code != 200:
-            raise Exception(f"Could not fetch PDF — HTTP {r.status_code}.")
-        if "html" in r.headers.get("content-type", "").lower():
-            raise Exception("Server returned HTML instead of PDF. Filing link may have expired.")
+        content = await fetch_filing_pdf(req.pdf_url, req.source)
         loop = asyncio.get_event_loop()
-        text = await loop.run_in_executor(executor, extract_pdf_text, r.content)
+        det  = {}
+        text = await loop.run_in_executor(executor, extract_pdf_text, content, det)
+        await record_filing_facts(det, req.symbol, req.source, req.pdf_url, analysis_id)
         result = await run_analysis(text)
-        await analyses_col.update_one({"analysis_id": analysis_id}, {"$set": {"status": "completed", "result": result}})
+        await complete_analysis(analysis_id, result)
         return {"analysis_id": analysis_id, "status": "completed", "result": result}
     except Exception as e:
         msg = str(e); logger.error(f"URL analysis failed {analysis_id}: {msg}")
-        await analyses_col.update_one({"analysis_id": analysis_id}, {"$set": {"status": "failed", "message": msg}})
+        await fail_analysis(analysis_id, msg)
         return {"analysis_id": analysis_id, "status": "failed", "message": msg}
 
+# ─── PORTFOLIO BATCH ─────────────────────────────────────────────────────────
+# A batch is a list of symbols (Screener) and/or filing URLs; every item becomes
+# an ordinary analyses record. Items reuse a stored analysis when a fresh one
+# exists. The rest queue on shared limits: the Screener fetch semaphore, a PDF
+# download pool per exchange, and a small LLM pool that yields to interactive
+# analyses and holds off for a while when every provider is failing.
+_BATCH_MAX_ITEMS        = 200
+_BATCH_LLM_CONCURRENCY  = 2
+_BATCH_PDF_CONCURRENCY  = 3     # per exchange
+_BATCH_PROVIDER_BACKOFF = 120   # seconds to hold LLM work after every provider failed
+_BATCH_ITEM_CONCURRENCY = 8     # items (docs + tasks) in flight per batch
+_batch_llm_sem = asyncio.Semaphore(_BATCH_LLM_CONCURRENCY)
+_batch_pdf_sem: dict = {}       # source -> Semaphore
+_batch_llm_paused_until = 0.0
+_batch_runs: dict = {}          # batch_id -> runner task, held until the batch finishes
+
+
+async def _batch_llm(text: str) -> dict:
+    global _batch_llm_paused_until
+    async with _batch_llm_sem:
+        while _batch_llm_paused_until > time.monotonic():
+            await asyncio.sleep(_batch_llm_paused_until - time.monotonic())
+        await analysis_idle.wait()
+        try:
+            return await run_analysis(text, background=True)
+        except Exception as e:
+            msg = str(e)
+            if msg.startswith("All AI providers failed") and "No API keys configured" not in msg:
+                _batch_llm_paused_until = time.monotonic() + _BATCH_PROVIDER_BACKOFF
+                logger.warning(f"Batch LLM work paused {_BATCH_PROVIDER_BACKOFF}s: {msg[:200]}")
+            raise
+
+
+async def _batch_symbol(analysis_id: str, symbol: str, consolidated: bool, since: datetime) -> tuple:
+    done   = await find_recent_screener_analysis(symbol, consolidated, since)
+    result = await adopt_analysis(analysis_id, done) if done else None
+    if result is not None:
+        return "reused", result
+    data = await fetch_screener_data(symbol, consolidated)
+    if not data["raw_text"] or len(data["raw_text"].strip()) < 200:
+        raise Exception(f"Screener.in returned insufficient data for '{symbol}'. Try the exact NSE ticker symbol.")
+    result = await _batch_llm(data["raw_text"])
+    await complete_analysis(analysis_id, result,
+                            {"company_name": data["company_name"], "url": data["url"], "ratios": data["ratios"]})
+    return "completed", result
+
+
+async def _batch_filing(analysis_id: str, filing: AnalyzeFromURLRequest) -> tuple:
+    running = _preanalysis_running.get(filing.pdf_url)
+    if running: await asyncio.shield(running)
+    done   = await find_completed_analysis(filing.pdf_url)
+    result = await adopt_analysis(analysis_id, done) if done else None
+    if result is not None:
+        return "reused", result
+    source = filing.source.lower()
+    async with _batch_pdf_sem.setdefault(source, asyncio.Semaphore(_BATCH_PDF_CONCURRENCY)):
+        content = await fetch_filing_pdf(filing.pdf_url, source)
+    det  = {}
+    text = await asyncio.get_event_loop().run_in_executor(executor, extract_pdf_text, content, det)
+    await record_filing_facts(det, filing.symbol, source, filing.pdf_url, analysis_id)
+    result = await _batch_llm(text)
+    await complete_analysis(analysis_id, result)
+    return "completed", result
+
+
+async def _batch_item(index: int, item, batch_id: str, user: dict, consolidated: bool, since: datetime) -> dict:
+    analysis_id = str(uuid.uuid4())
+    is_symbol   = isinstance(item, str)
+    ident = {"symbol": item} if is_symbol else {"pdf_url": item.pdf_url}
+    doc = {"analysis_id": analysis_id, "user_id": user["user_id"], "is_guest": False, "batch_id": batch_id,
+           "status": "processing", "created_at": datetime.utcnow().isoformat(), "result": None,
+           **analysis_expiry(user)}
+    if is_symbol:
+        doc.update({"filename": f"{item}_screener", "source": "screener", "symbol": item, "consolidated": consolidated})
+    else:
+        doc.update({"filename": item.filename, "source": item.source, "pdf_url": item.pdf_url})
+    await analyses_col.insert_one(doc)
+    try:
+        status, result = await (_batch_symbol(analysis_id, item, consolidated, since) if is_symbol
+                                else _batch_filing(analysis_id, item))
+    except Exception as e:
+        msg = str(e)
+        logger.warning(f"Batch {batch_id} item {ident} failed: {msg[:200]}")
+        await fail_analysis(analysis_id, msg)
+        return {"index": index, **ident, "analysis_id": analysis_id, "status": "failed", "message": msg}
+    result = result or {}
+    return {"index": index, **ident, "analysis_id": analysis_id, "status": status,
+            **{k: result.get(k) for k in ANALYSIS_SUMMARY_FIELDS},
+            "red_flags": result.get("red_flags") or []}
+
+
+async def _run_batch(batch_id: str, items: list, user: dict, consolidated: bool, since: datetime,
+                     out: asyncio.Queue):
+    """Feed items through at most _BATCH_ITEM_CONCURRENCY at a time; each finished row
+    goes to `out`, then None marks the end."""
+    slots = asyncio.Semaphore(_BATCH_ITEM_CONCURRENCY)
+
+    async def _one(index: int, item):
+        try:
+            row = await _batch_item(index, item, batch_id, user, consolidated, since)
+        except Exception as e:
+            ident = {"symbol": item} if isinstance(item, str) else {"pdf_url": item.pdf_url}
+            logger.error(f"Batch {batch_id} item {ident} crashed: {e}")
+            row = {"index": index, **ident, "analysis_id": None, "status": "failed", "message": str(e)}
+        finally:
+            slots.release()
+        out.put_nowait(row)
+
+    running = []
+    for index, item in enumerate(items):
+        await slots.acquire()
+        running.append(asyncio.create_task(_one(index, item)))
+    await asyncio.gather(*running)
+    out.put_nowait(None)
+
+
+def portfolio_rollup(items: list) -> dict:
+    """Portfolio-level view of the finished batch items."""
+    ok = [i for i in items if i["status"] != "failed"]
+    scores = np.array([_ratio_float(i.get("health_score")) for i in ok], dtype=np.float64)
+    scored = ~np.isnan(scores)
+    flagged = sorted((i for i in ok if i["red_flags"]), key=lambda i: -len(i["red_flags"]))
+
+    def _name(i):
+        return i.get("symbol") or i.get("company_name") or i.get("pdf_url")
+
+    stats = None
+    if scored.any():
+        s = scores[scored]
+        stats = {"mean": round(float(s.mean()), 1), "median": round(float(np.median(s)), 1),
+                 "min": float(s.min()), "max": float(s.max())}
+    weakest = [ok[j] for j in np.argsort(np.where(scored, scores, np.inf))[:5] if scored[j]]
+    return {
+        "total":     len(items),
+        "analysed":  len(ok),
+        "reused":    sum(i["status"] == "reused" for i in ok),
+        "failed":    len(items) - len(ok),
+        "health_score": stats,
+        "health_labels":     dict(Counter(i["health_label"] for i in ok if i.get("health_label"))),
+        "investor_verdicts": dict(Counter(i["investor_verdict"] for i in ok if i.get("investor_verdict"))),
+        "weakest": [{"name": _name(i), "analysis_id": i["analysis_id"], "health_score": i.get("health_score")}
+                    for i in weakest],
+        "red_flags": {
+            "total":     sum(len(i["red_flags"]) for i in ok),
+            "companies": len(flagged),
+            "most_flagged": [{"name": _name(i), "analysis_id": i["analysis_id"], "count": len(i["red_flags"]),
+                              "flags": i["red_flags"][:3]} for i in flagged[:10]],
+        },
+    }
+
+
+@app.post("/api/analyze-batch")
+async def analyze_batch(req: BatchAnalyzeRequest, user=Depends(get_current_user)):
+    """Analyse a whole portfolio. Streams NDJSON: a `started` line, one `item` line per
+    holding as it finishes, then a `summary` line with the portfolio roll-up."""
+    symbols = list(dict.fromkeys(s.strip().upper() for s in req.symbols if s.strip()))
+    filings = list({f.pdf_url: f for f in req.filings}.values())
+    items   = symbols + filings
+    if not items:
+        raise HTTPException(400, "Provide symbols and/or filings to analyse")
+    if len(items) > _BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"Maximum {_BATCH_MAX_ITEMS} items per batch")
+
+    batch_id = str(uuid.uuid4())
+    since    = datetime.utcnow() - timedelta(hours=max(req.max_age_hours, 0))
+    for sym in symbols: note_symbol_demand(sym, 0.5)
+    logger.info(f"Batch {batch_id}: {len(symbols)} symbols, {len(filings)} filings for {user['user_id']}")
+    # The run is not tied to the response: a client that disconnects still gets
+    # every item recorded in its history.
+    rows: asyncio.Queue = asyncio.Queue()
+    runner = asyncio.create_task(_run_batch(batch_id, items, user, req.consolidated, since, rows))
+    _batch_runs[batch_id] = runner
+    runner.add_done_callback(lambda _t: _batch_runs.pop(batch_id, None))
+
+    async def _stream():
+        yield orjson.dumps({"event": "started", "batch_id": batch_id, "total": len(items)}) + b"\n"
+        finished = []
+        while True:
+            row = await rows.get()
+            if row is None: break
+            finished.append(row)
+            yield orjson.dumps({"event": "item", "done": len(finished), "total": len(items), **row}) + b"\n"
+        yield orjson.dumps({"event": "summary", "batch_id": batch_id, **portfolio_rollup(finished)}) + b"\n"
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+# Completed analyses are immutable, so their serialised body is cached (LRU,
+# bounded TTL so deletes on other workers age out) with a strong ETag, and
+# clients/CDNs are allowed to keep them. The ETag is the content-addressed
+# result_hash, so a revalidation is answered before the blob is read.
+_ANALYSIS_HOT_MAX = 256
+_ANALYSIS_HOT_TTL = 600
+_ANALYSIS_MAX_AGE = 86400
+_analysis_hot: "OrderedDict[tuple, tuple]" = OrderedDict()   # (analysis_id, public) -> (expires, body, etag)
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header: return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag: return True
+    return False
+
+def _analysis_cache_headers(etag: str, public: bool) -> dict:
+    return {"ETag": etag, "Cache-Control": f"{'public' if public else 'private'}, max-age={_ANALYSIS_MAX_AGE}"}
+
+def _invalidate_analysis_cache(analysis_id: str):
+    _analysis_hot.pop((analysis_id, True), None)
+    _analysis_hot.pop((analysis_id, False), None)
+
+async def _serve_analysis(request: Request, analysis_id: str, public: bool) -> Response:
+    key = (analysis_id, public)
+    hit = _analysis_hot.get(key)
+    if hit and hit[0] > time.monotonic():
+        _analysis_hot.move_to_end(key)
+        _, body, etag = hit
+    else:
+        doc = await load_analysis(analysis_id)
+        if not doc or (public and doc.get("status") != "completed"): raise HTTPException(404, "Analysis not found")
+        if public: doc.pop("user_id", None)
+        digest = doc.get("result_hash") if doc.get("status") == "completed" else None
+        etag   = f'"{digest[:32]}-{"p" if public else "o"}"' if digest else None
+        if etag and _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=_analysis_cache_headers(etag, public))
+        doc  = await hydrate_analysis(doc)
+        body = orjson.dumps(doc, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        if doc.get("status") != "completed":
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+        etag = etag or f'"{hashlib.sha256(body).hexdigest()[:32]}"'   # legacy docs with an embedded result
+        _analysis_hot[key] = (time.monotonic() + _ANALYSIS_HOT_TTL, body, etag)
+        _analysis_hot.move_to_end(key)
+        while len(_analysis_hot) > _ANALYSIS_HOT_MAX: _analysis_hot.popitem(last=False)
+    headers = _analysis_cache_headers(etag, public)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/public/analyses/{analysis_id}")
-async def public_analysis(analysis_id: str):
-    doc = await analyses_col.find_one({"analysis_id": analysis_id})
-    if not doc or doc.get("status") != "completed": raise HTTPException(404, "Analysis not found")
-    doc.pop("_id", None); doc.pop("user_id", None)
-    return doc
+async def public_analysis(analysis_id: str, request: Request):
+    return await _serve_analysis(request, analysis_id, public=True)
+
+# History rows carry the summary fields (name, score, verdict, statement type,
+# period) rather than the full result, which is fetched from /api/analyses/{id}
+# when a row is opened.
+_HISTORY_PAGE_MAX = 200
+ANALYSIS_SUMMARY_PROJECTION = {
+    "_id": 0, "analysis_id": 1, "filename": 1, "source": 1, "status": 1, "message": 1, "created_at": 1,
+    "summary": 1, **{f"result.{k}": 1 for k in ANALYSIS_SUMMARY_FIELDS},
+}
+
+def _encode_history_cursor(doc: dict) -> str:
+    raw = json.dumps([doc.get("created_at") or "", doc["analysis_id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_history_cursor(cursor: str):
+    try:
+        created_at, analysis_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), str(analysis_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
 
 @app.get("/api/analyses")
-async def list_analyses(user=Depends(get_current_user)):
-    docs = []
-    async for doc in analyses_col.find({"user_id": user["user_id"]}).sort("created_at", -1):
-        doc.pop("_id", None); docs.append(doc)
+async def list_analyses(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None,
+                        user=Depends(get_current_user)):
+    """Newest-first analysis summaries. Without limit/cursor every analysis is
+    returned, which is what the shipped clients expect. With them the list is
+    keyset-paginated on (created_at, analysis_id); pass the X-Next-Cursor header
+    back as ?cursor=."""
+    paged = limit is not None or cursor is not None
+    query = {"user_id": user["user_id"]}
+    if cursor:
+        created_at, analysis_id = _decode_history_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "analysis_id": {"$lt": analysis_id}},
+        ]
+    limit = max(1, min(limit or _HISTORY_PAGE_MAX, _HISTORY_PAGE_MAX)) if paged else None
+    fetch = limit + 1 if paged else None
+    order = [("created_at", -1), ("analysis_id", -1)]
+    hot, archived = await asyncio.gather(
+        analyses_col.find(query, ANALYSIS_SUMMARY_PROJECTION).sort(order).limit(fetch or 0).to_list(fetch),
+        analyses_archive_col.find(query, ANALYSIS_SUMMARY_PROJECTION).sort(order).limit(fetch or 0).to_list(fetch),
+    )
+    docs = hot + archived
+    if archived:
+        docs.sort(key=lambda d: (d.get("created_at") or "", d["analysis_id"]), reverse=True)
+    if paged and len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = _encode_history_cursor(docs[-1])
+    for d in docs:
+        if "summary" in d: d["result"] = d.pop("summary")
     return docs
 
 @app.get("/api/analyses/{analysis_id}")
-async def get_analysis(analysis_id: str):
-    doc = await analyses_col.find_one({"analysis_id": analysis_id})
-    if not doc: raise HTTPException(404, "Analysis not found")
-    doc.pop("_id", None); return doc
+async def get_analysis(analysis_id: str, request: Request):
+    return await _serve_analysis(request, analysis_id, public=False)
 
 @app.delete("/api/analyses/{analysis_id}")
 async def delete_analysis(analysis_id: str, user=Depends(get_current_user)):
     r = await analyses_col.delete_one({"analysis_id": analysis_id, "user_id": user["user_id"]})
+    if r.deleted_count == 0:
+        r = await analyses_archive_col.delete_one({"analysis_id": analysis_id, "user_id": user["user_id"]})
     if r.deleted_count == 0: raise HTTPException(404, "Not found")
+    _invalidate_analysis_cache(analysis_id)
     return {"deleted": True}
 
 @app.post("/api/generate-pdf")